@@ -0,0 +1,130 @@
+import shutil
+import subprocess
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+FRAME_SEC = 0.02
+BLOCK_FRAMES = 500
+
+
+def detect_silences(
+    input_path,
+    threshold_db=-40.0,
+    min_silence=0.3,
+    frame_sec=FRAME_SEC,
+    sample_rate=SAMPLE_RATE,
+):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-i",
+        input_path,
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-f",
+        "s16le",
+        "-",
+    ]
+    frame_len = max(1, int(round(sample_rate * frame_sec)))
+    frame_sec = frame_len / sample_rate
+    frame_bytes = frame_len * 2
+    block_bytes = frame_bytes * BLOCK_FRAMES
+
+    silences = []
+    frame_index = 0
+    was_silent = False
+    run_start = 0.0
+    leftover = b""
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes)
+            if not chunk:
+                break
+            data = leftover + chunk
+            usable = len(data) - len(data) % frame_bytes
+            leftover = data[usable:]
+            if not usable:
+                continue
+            frames = np.frombuffer(data[:usable], dtype="<i2").reshape(-1, frame_len)
+            frames = frames.astype(np.float32) / 32768.0
+            rms = np.sqrt(np.mean(frames * frames, axis=1))
+            silent = 20.0 * np.log10(np.maximum(rms, 1e-10)) < threshold_db
+
+            flags = np.concatenate(([was_silent], silent)).astype(np.int8)
+            for edge in np.flatnonzero(np.diff(flags)).tolist():
+                at = (frame_index + edge) * frame_sec
+                if silent[edge]:
+                    run_start = at
+                elif at - run_start >= min_silence:
+                    silences.append((run_start, at))
+            was_silent = bool(silent[-1])
+            frame_index += len(silent)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode audio from {input_path}.")
+    end = frame_index * frame_sec
+    if was_silent and end - run_start >= min_silence:
+        silences.append((run_start, end))
+    return silences
+
+
+def refine_candidates(candidates, silences, min_overlap=0.5, pad=0.05):
+    refined = []
+    rejected = []
+    first = 0
+    used = -1
+    for cand in sorted(candidates, key=lambda item: item["gap_start"]):
+        gap_start = cand["gap_start"]
+        gap_end = cand["gap_end"]
+        while first < len(silences) and silences[first][1] <= gap_start:
+            first += 1
+
+        overlap = 0.0
+        best = None
+        index = first
+        while index < len(silences) and silences[index][0] < gap_end:
+            start, end = silences[index]
+            covered = min(end, gap_end) - max(start, gap_start)
+            overlap += covered
+            # A silence spanning two gaps is only snapped to by the first one.
+            if index > used and (best is None or covered > best[2]):
+                best = (start, end, covered, index)
+            index += 1
+
+        duration = gap_end - gap_start
+        if duration <= 0 or overlap / duration < min_overlap:
+            cand["decision"] = "KEEP"
+            cand["reason"] = "audio is not silent during this gap"
+            rejected.append(cand)
+            continue
+
+        if best is None:
+            refined.append(cand)
+            continue
+        used = best[3]
+        # Stay between the neighbouring captions so no spoken words are cut.
+        new_start = round(max(best[0] + pad, gap_start), 3)
+        new_end = round(min(best[1] - pad, gap_end), 3)
+        if new_end > new_start:
+            cand["caption_gap_start"] = gap_start
+            cand["caption_gap_end"] = gap_end
+            cand["gap_start"] = new_start
+            cand["gap_end"] = new_end
+            cand["gap_duration"] = round(new_end - new_start, 3)
+        refined.append(cand)
+    return refined, rejected
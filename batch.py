@@ -0,0 +1,317 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from decision_cache import DecisionCache
+from gemini_client import GeminiClient
+from metrics import Trace
+from pipeline import (
+    add_pipeline_args,
+    open_local_scorer,
+    open_render_cache,
+    plan_video,
+    render_plan,
+)
+from rate_limiter import RateLimiter
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v")
+TRANSCRIPT_EXTENSIONS = (".srt", ".vtt", ".txt")
+ITEM_STATUS_FILE = "batch_item.json"
+SUMMARY_FILE = "batch_summary.json"
+
+
+def _scan_directory(path):
+    names = sorted(os.listdir(path))
+    entries = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in VIDEO_EXTENSIONS:
+            continue
+        for transcript_ext in TRANSCRIPT_EXTENSIONS:
+            transcript = stem + transcript_ext
+            if transcript in names:
+                entries.append({"video": name, "transcript": transcript})
+                break
+        else:
+            print(f"No transcript found for {name}, skipping.", file=sys.stderr)
+    return entries
+
+
+def load_manifest(path, outdir):
+    if os.path.isdir(path):
+        base = path
+        entries = _scan_directory(path)
+    else:
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, "r", encoding="utf-8", newline="") as handle:
+            if path.lower().endswith(".csv"):
+                entries = list(csv.DictReader(handle))
+            elif path.lower().endswith(".json"):
+                entries = json.load(handle)
+                if isinstance(entries, dict):
+                    entries = entries.get("items", [])
+            else:
+                raise ValueError("Manifest must be a directory, a .csv or a .json file.")
+
+    items = []
+    used = set()
+    for entry in entries:
+        if not entry.get("video") or not entry.get("transcript"):
+            raise ValueError(f"Manifest entry needs video and transcript: {entry}")
+        video = os.path.join(base, entry["video"])
+        name = entry.get("name") or os.path.splitext(os.path.basename(video))[0]
+        unique = name
+        suffix = 2
+        while unique in used:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        used.add(unique)
+        items.append(
+            {
+                "name": unique,
+                "video": video,
+                "transcript": os.path.join(base, entry["transcript"]),
+                "outdir": os.path.join(base, entry["outdir"])
+                if entry.get("outdir")
+                else os.path.join(outdir, unique),
+            }
+        )
+    return items
+
+
+def _finished_record(item):
+    path = os.path.join(item["outdir"], ITEM_STATUS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            record = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or record.get("status") != "done":
+        return None
+    return record
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2)
+
+
+class _SharedClient:
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._client is None:
+                self._client = GeminiClient()
+            return self._client
+
+    def __getattr__(self, name):
+        # Only built once a video has gaps left for Gemini, so batches decided
+        # locally or from the cache never need an API key.
+        return getattr(self.get(), name)
+
+
+def run_batch(args, items):
+    pending = []
+    records = []
+    for item in items:
+        previous = None if args.force else _finished_record(item)
+        if previous is not None:
+            # Keep the earlier run's numbers so the totals still cover this item.
+            previous.pop("video", None)
+            records.append(dict(previous, name=item["name"], status="skipped"))
+        elif not os.path.isfile(item["video"]) or not os.path.isfile(item["transcript"]):
+            records.append(
+                {"name": item["name"], "status": "failed", "error": "input file not found"}
+            )
+        else:
+            pending.append(item)
+
+    client = _SharedClient()
+    rate_limiter = RateLimiter(args.llm_rpm)
+    cache = None
+    if args.use_decision_cache:
+        cache = DecisionCache(
+            args.decision_cache or os.path.join(args.outdir, ".cache", "decisions.sqlite")
+        )
+    render_cache = open_render_cache(args)
+
+    def plan_item(item):
+        trace = Trace()
+        started = time.perf_counter()
+        result = plan_video(
+            args,
+            item["video"],
+            item["transcript"],
+            item["outdir"],
+            client=client,
+            rate_limiter=rate_limiter,
+            cache=cache,
+            trace=trace,
+        )
+        return result, trace, time.perf_counter() - started
+
+    def render_item(item, keep_segments, trace):
+        started = time.perf_counter()
+        rendered = render_plan(
+            args, item["video"], keep_segments, item["outdir"], render_cache, trace
+        )
+        return rendered, time.perf_counter() - started
+
+    def finish(item, record, trace):
+        trace.write(os.path.join(item["outdir"], "trace.json"))
+        if record["status"] == "done":
+            _write_json(
+                os.path.join(item["outdir"], ITEM_STATUS_FILE),
+                dict(record, video=item["video"], finished=time.time()),
+            )
+        records.append(record)
+        print(f"[{record['status']}] {item['name']}", file=sys.stderr)
+
+    started = time.perf_counter()
+    plan_pool = ThreadPoolExecutor(max_workers=max(1, args.plan_jobs))
+    render_pool = ThreadPoolExecutor(max_workers=max(1, args.render_jobs))
+    try:
+        planning = {plan_pool.submit(plan_item, item): item for item in pending}
+        rendering = {}
+        # Renders start as soon as their plan is ready, so ffmpeg for one video
+        # overlaps the Gemini phase of the next.
+        for future in as_completed(planning):
+            item = planning[future]
+            try:
+                result, trace, plan_sec = future.result()
+            except Exception as exc:
+                records.append({"name": item["name"], "status": "failed", "error": str(exc)})
+                print(f"[failed] {item['name']}: {exc}", file=sys.stderr)
+                continue
+            record = {
+                "name": item["name"],
+                "status": "done",
+                "outdir": item["outdir"],
+                "gaps": len(result["planned"]),
+                "cut": sum(1 for c in result["planned"] if c.get("decision") == "CUT"),
+                "llm_calls": result["llm_stats"]["llm_calls"],
+                "llm_calls_saved": result["llm_stats"]["llm_calls_saved"],
+                "prompt_tokens": result["llm_stats"]["prompt_tokens"],
+                "total_duration_sec": round(result["total_duration"], 3),
+                "edited_duration_sec": round(result["estimated_duration"], 3),
+                "plan_sec": round(plan_sec, 3),
+                "rendered": None,
+            }
+            if args.render and result["keep_segments"]:
+                job = render_pool.submit(
+                    render_item, item, result["keep_segments"], trace
+                )
+                rendering[job] = (item, record, trace)
+            else:
+                finish(item, record, trace)
+
+        for future in as_completed(rendering):
+            item, record, trace = rendering[future]
+            try:
+                record["rendered"], render_sec = future.result()
+                record["render_sec"] = round(render_sec, 3)
+            except Exception as exc:
+                record["status"] = "failed"
+                record["error"] = f"render failed: {exc}"
+            finish(item, record, trace)
+    finally:
+        plan_pool.shutdown(wait=True, cancel_futures=True)
+        render_pool.shutdown(wait=True, cancel_futures=True)
+        cache_stats = cache.stats() if cache is not None else None
+        if cache is not None:
+            cache.close()
+
+    order = {item["name"]: index for index, item in enumerate(items)}
+    records.sort(key=lambda record: order.get(record["name"], len(order)))
+    totals = {
+        status: sum(1 for record in records if record["status"] == status)
+        for status in ("done", "skipped", "failed")
+    }
+    totals["llm_calls"] = sum(record.get("llm_calls", 0) for record in records)
+    totals["llm_calls_saved"] = sum(record.get("llm_calls_saved", 0) for record in records)
+    totals["prompt_tokens"] = sum(record.get("prompt_tokens", 0) for record in records)
+    totals["total_duration_sec"] = round(
+        sum(record.get("total_duration_sec", 0.0) for record in records), 3
+    )
+    totals["edited_duration_sec"] = round(
+        sum(record.get("edited_duration_sec", 0.0) for record in records), 3
+    )
+    totals["wall_sec"] = round(time.perf_counter() - started, 3)
+    if cache_stats is not None:
+        totals["decision_cache"] = cache_stats
+    return {"totals": totals, "items": records}
+
+
+def build_batch_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Process many videos from a directory or a CSV/JSON manifest",
+    )
+    parser.add_argument(
+        "manifest",
+        help="Directory of videos with same-named transcripts, or a CSV/JSON manifest "
+        "with video, transcript and optional name/outdir columns",
+    )
+    parser.add_argument("--outdir", default="outputs/batch", help="Output directory")
+    parser.add_argument(
+        "--plan-jobs",
+        type=int,
+        default=2,
+        help="Videos parsed and sent to Gemini at the same time",
+    )
+    parser.add_argument(
+        "--render-jobs", type=int, default=1, help="Videos rendered at the same time"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Reprocess items that already finished"
+    )
+    add_pipeline_args(parser)
+    return parser
+
+
+def batch_main(argv):
+    args = build_batch_parser().parse_args(argv)
+    try:
+        open_local_scorer(args)
+    except (OSError, ValueError) as exc:
+        print(f"Could not load local model: {exc}", file=sys.stderr)
+        return 1
+    try:
+        items = load_manifest(args.manifest, args.outdir)
+    except (OSError, ValueError) as exc:
+        print(f"Could not read manifest: {exc}", file=sys.stderr)
+        return 1
+    if not items:
+        print("Manifest has no items.", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.outdir, exist_ok=True)
+    summary = run_batch(args, items)
+    summary_path = os.path.join(args.outdir, SUMMARY_FILE)
+    _write_json(summary_path, summary)
+
+    totals = summary["totals"]
+    print(
+        f"Items: done={totals['done']} skipped={totals['skipped']} "
+        f"failed={totals['failed']}"
+    )
+    print(
+        f"Gemini calls: {totals['llm_calls']} (~{totals['prompt_tokens']} prompt tokens, "
+        f"~{totals['llm_calls_saved']} saved by the local decider)"
+    )
+    print(
+        f"Duration: {totals['total_duration_sec']:.2f}s -> "
+        f"{totals['edited_duration_sec']:.2f}s"
+    )
+    print(f"Wall time: {totals['wall_sec']:.2f}s")
+    print(f"Summary: {summary_path}")
+    return 1 if totals["failed"] else 0
@@ -0,0 +1,386 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from cutter import compute_keep_segments
+from decider import _build_prompt, _pack_batches, decide_gaps
+from ffmpeg_render import RENDER_MODES, render_video
+from gap_detector import detect_gaps
+from metrics import _percentile
+from transcript_parser import parse_transcript
+
+
+TRANSCRIPT_FORMATS = ("srt", "vtt", "plain")
+WORDS = (
+    "so the next thing we want to look at is how this part of the system "
+    "handles a much larger input without slowing down or running out of memory"
+).split()
+ID_RE = re.compile(r"^ID: (\S+)", re.MULTILINE)
+
+
+def _srt_time(seconds, sep=","):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{sep}{millis:03d}"
+
+
+def synthetic_captions(count, gap_density=0.2, seed=0):
+    rng = random.Random(seed)
+    cursor = 0.5
+    for _ in range(count):
+        start = cursor
+        end = start + rng.uniform(1.0, 4.0)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        yield {"start_sec": round(start, 3), "end_sec": round(end, 3), "text": text}
+        if rng.random() < gap_density:
+            cursor = end + rng.uniform(0.8, 3.0)
+        else:
+            cursor = end + rng.uniform(0.05, 0.4)
+
+
+def synthetic_segments(duration, seed=0):
+    # Short keeps and short cuts, so even a few seconds of video exercise many
+    # cut boundaries.
+    rng = random.Random(seed)
+    segments = []
+    cursor = rng.uniform(0.0, 0.3)
+    while cursor < duration:
+        end = min(duration, cursor + rng.uniform(0.4, 2.0))
+        segments.append([round(cursor, 3), round(end, 3)])
+        cursor = end + rng.uniform(0.1, 0.6)
+    return segments
+
+
+def write_transcript(path, fmt="srt", count=1000, gap_density=0.2, seed=0):
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"Unknown transcript format: {fmt}")
+    end = 0.0
+    with open(path, "w", encoding="utf-8") as handle:
+        if fmt == "vtt":
+            handle.write("WEBVTT\n\n")
+        for index, item in enumerate(synthetic_captions(count, gap_density, seed), 1):
+            start, end = item["start_sec"], item["end_sec"]
+            if fmt == "plain":
+                handle.write(f"{start:.3f} {end:.3f} {item['text']}\n")
+                continue
+            if fmt == "srt":
+                handle.write(f"{index}\n")
+            sep = "," if fmt == "srt" else "."
+            handle.write(f"{_srt_time(start, sep)} --> {_srt_time(end, sep)}\n")
+            handle.write(f"{item['text']}\n\n")
+    return end
+
+
+class FakeGeminiClient:
+    def __init__(self, latency=0.05, error_rate=0.0, seed=0, model="fake-gemini"):
+        self.model = model
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self.errors = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def _roll(self, *parts):
+        data = ":".join(str(part) for part in (self.seed, *parts)).encode("utf-8")
+        return int.from_bytes(hashlib.sha256(data).digest()[:8], "big") / 2**64
+
+    def generate_text(self, prompt):
+        started = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.latency)
+        try:
+            if self._roll("error", call) < self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                raise RuntimeError("Fake Gemini transient error.")
+            decisions = [
+                {
+                    "id": gap_id,
+                    "decision": "CUT" if self._roll("decision", gap_id) < 0.7 else "KEEP",
+                    "reason": "synthetic decision",
+                }
+                for gap_id in ID_RE.findall(prompt)
+            ]
+            return json.dumps(decisions)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+
+
+def make_test_video(path, duration=30.0, size="640x360", rate=25):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=size={size}:rate={rate}:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-shortest",
+        path,
+    ]
+    subprocess.run(command, check=True)
+
+
+def measure(func, repeat=3, items=None):
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(timings)
+    report = {
+        "seconds": round(best, 6),
+        "mean_seconds": round(statistics.mean(timings), 6),
+        "peak_python_mb": round(peak / 1024 / 1024, 3),
+    }
+    if items:
+        report["items"] = items
+        report["items_per_sec"] = round(items / best, 1) if best else None
+    return report, result
+
+
+def run_benchmarks(args, workdir):
+    results = {}
+    transcript_path = os.path.join(workdir, f"transcript.{args.format}")
+    if args.format == "plain":
+        transcript_path = os.path.join(workdir, "transcript.txt")
+    write_transcript(
+        transcript_path, args.format, args.captions, args.gap_density, args.seed
+    )
+
+    report, captions = measure(
+        lambda: parse_transcript(transcript_path), args.repeat, args.captions
+    )
+    report["file_mb"] = round(os.path.getsize(transcript_path) / 1024 / 1024, 3)
+    results["parse_transcript"] = report
+
+    report, candidates = measure(
+        lambda: detect_gaps(captions, min_gap=args.min_gap, context=args.context),
+        args.repeat,
+        args.captions,
+    )
+    report["candidates"] = len(candidates)
+    results["detect_gaps"] = report
+
+    batches = _pack_batches(candidates, args.batch_size, args.token_budget)
+    report, _ = measure(
+        lambda: [_build_prompt(batch) for batch in batches], args.repeat, len(candidates)
+    )
+    report["batches"] = len(batches)
+    results["build_prompt"] = report
+
+    client = FakeGeminiClient(args.llm_latency, args.llm_error_rate, args.seed)
+    llm_stats = {"llm_calls": 0, "prompt_tokens": 0}
+    started = time.perf_counter()
+    decisions = decide_gaps(
+        candidates,
+        client,
+        batch_size=args.batch_size,
+        concurrency=args.llm_concurrency,
+        token_budget=args.token_budget,
+        stats=llm_stats,
+    )
+    elapsed = time.perf_counter() - started
+    results["decide_gaps"] = {
+        "seconds": round(elapsed, 6),
+        "items": len(candidates),
+        "items_per_sec": round(len(candidates) / elapsed, 1) if elapsed else None,
+        "llm_calls": llm_stats["llm_calls"],
+        "llm_errors": client.errors,
+        "prompt_tokens": llm_stats["prompt_tokens"],
+        "call_latency_p50_sec": _percentile(client.latencies, 0.5, digits=6),
+        "call_latency_p95_sec": _percentile(client.latencies, 0.95, digits=6),
+    }
+
+    report, (keep_segments, _) = measure(
+        lambda: compute_keep_segments(captions, candidates, decisions),
+        args.repeat,
+        len(candidates),
+    )
+    report["keep_segments"] = len(keep_segments)
+    results["compute_keep_segments"] = report
+
+    if args.video_seconds > 0:
+        results["render_video"] = _bench_render(args, workdir)
+    return results
+
+
+def _bench_render(args, workdir):
+    video_path = os.path.join(workdir, "testsrc.mp4")
+    make_test_video(video_path, args.video_seconds)
+    segments = synthetic_segments(args.video_seconds, args.seed)
+    output_path = os.path.join(workdir, "edited.mp4")
+    started = time.perf_counter()
+    mode = render_video(
+        video_path,
+        segments,
+        output_path,
+        mode=args.render_mode,
+        workers=args.render_workers,
+    )
+    elapsed = time.perf_counter() - started
+    edited = sum(end - start for start, end in segments)
+    return {
+        "seconds": round(elapsed, 6),
+        "mode": mode,
+        "segments": len(segments),
+        "edited_seconds": round(edited, 3),
+        "realtime_factor": round(edited / elapsed, 2) if elapsed else None,
+        "peak_child_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=0.2, min_seconds=0.005):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("seconds"):
+            continue
+        ratio = current["seconds"] / previous["seconds"]
+        current["baseline_seconds"] = previous["seconds"]
+        current["vs_baseline"] = round(ratio, 3)
+        # Sub-millisecond stages jitter by more than the threshold on their own.
+        slower = current["seconds"] - previous["seconds"]
+        if ratio > 1 + threshold and slower >= min_seconds:
+            regressions.append(name)
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the silence cutter pipeline")
+    parser.add_argument("--captions", type=int, default=10000, help="Synthetic captions")
+    parser.add_argument(
+        "--gap-density", type=float, default=0.2, help="Share of captions followed by a long gap"
+    )
+    parser.add_argument("--format", choices=TRANSCRIPT_FORMATS, default="srt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--min-gap", type=float, default=0.8)
+    parser.add_argument("--context", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.02, help="Fake Gemini seconds per call"
+    )
+    parser.add_argument(
+        "--llm-error-rate", type=float, default=0.0, help="Fake Gemini failure probability"
+    )
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--video-seconds",
+        type=float,
+        default=30.0,
+        help="Length of the generated test video (0 skips the render benchmark)",
+    )
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default="reencode")
+    parser.add_argument("--render-workers", type=int, default=1)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Compare against this report")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline before failing",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.005,
+        help="Ignore slowdowns smaller than this many seconds",
+    )
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        results = run_benchmarks(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "captions": args.captions,
+            "gap_density": args.gap_density,
+            "format": args.format,
+            "llm_latency": args.llm_latency,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_concurrency": args.llm_concurrency,
+            "video_seconds": args.video_seconds,
+        },
+        "benchmarks": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            regressions = compare_to_baseline(
+                results, json.load(handle), args.threshold, args.min_seconds
+            )
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+    if regressions:
+        print(f"Slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+import time
+
+
+class HashingWriter:
+    def __init__(self, path, handle):
+        self.path = path
+        self.size = 0
+        self.committed = False
+        self._handle = handle
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._handle.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._handle.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._handle, name)
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def open_writer(self):
+        handle, path = tempfile.mkstemp(prefix="upload_", dir=self.tmp_dir)
+        return HashingWriter(path, os.fdopen(handle, "w+b"))
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def commit(self, writer):
+        writer.flush()
+        os.fsync(writer.fileno())
+        digest = writer.hexdigest()
+        blob_path = self.path_for(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.utime(blob_path)
+        else:
+            os.chmod(writer.path, 0o444)
+            os.replace(writer.path, blob_path)
+            writer.committed = True
+        writer.close()
+        return digest, blob_path
+
+    def link(self, blob_path, dest_path):
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            os.symlink(os.path.abspath(blob_path), dest_path)
+
+    def _iter_blobs(self):
+        for directory in os.scandir(self.root):
+            if directory.is_dir() and directory.path != self.tmp_dir:
+                yield from os.scandir(directory.path)
+
+    def collect_garbage(self, in_use=(), min_age_sec=3600):
+        # A blob with a single link is only referenced by the store itself,
+        # unless a job reaches it through a symlink.
+        cutoff = time.time() - min_age_sec
+        removed = 0
+        for entry in self._iter_blobs():
+            stat = entry.stat()
+            if (
+                stat.st_nlink > 1
+                or stat.st_mtime > cutoff
+                or os.path.realpath(entry.path) in in_use
+            ):
+                continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+        for entry in os.scandir(self.tmp_dir):
+            if entry.stat().st_mtime < cutoff - 86400:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+        return removed
+
+    def usage(self):
+        count = 0
+        total = 0
+        for entry in self._iter_blobs():
+            count += 1
+            total += entry.stat().st_size
+        return {"blobs": count, "bytes": total}
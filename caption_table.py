@@ -0,0 +1,106 @@
+import sys
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+
+class CaptionTable(Sequence):
+    def __init__(self, start, end, text):
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.text = np.asarray(text, dtype=object)
+        if not (len(self.start) == len(self.end) == len(self.text)):
+            raise ValueError("Caption columns must have the same length.")
+
+    @classmethod
+    def from_captions(cls, captions):
+        if isinstance(captions, cls):
+            return captions
+        start = array("d")
+        end = array("d")
+        text = []
+        ordered = True
+        for item in captions:
+            if start and (item["start_sec"], item["end_sec"]) < (start[-1], end[-1]):
+                ordered = False
+            start.append(item["start_sec"])
+            end.append(item["end_sec"])
+            text.append(sys.intern(item["text"]))
+        text_column = np.empty(len(text), dtype=object)
+        text_column[:] = text
+        start = np.frombuffer(start, dtype=np.float64)
+        end = np.frombuffer(end, dtype=np.float64)
+        if not ordered:
+            order = np.lexsort((end, start))
+            start, end, text_column = start[order], end[order], text_column[order]
+        return cls(start, end, text_column)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("CaptionTable slices must be contiguous.")
+            return self.slice(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("caption index out of range")
+        return self.row(index)
+
+    def __iter__(self):
+        for start, end, text in zip(self.start.tolist(), self.end.tolist(), self.text):
+            yield {"start_sec": start, "end_sec": end, "text": text}
+
+    def row(self, index):
+        return {
+            "start_sec": float(self.start[index]),
+            "end_sec": float(self.end[index]),
+            "text": self.text[index],
+        }
+
+    def slice(self, start, stop):
+        return CaptionSlice(self, start, max(start, stop))
+
+    def duration(self):
+        return float(self.end.max()) if len(self) else 0.0
+
+    def to_dicts(self):
+        return list(self)
+
+
+class CaptionSlice(Sequence):
+    def __init__(self, table, start, stop):
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("CaptionSlice slices must be contiguous.")
+            return CaptionSlice(self.table, self.start + start, self.start + stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("caption index out of range")
+        return self.table.row(self.start + index)
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self.table.row(index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"CaptionSlice({self.start}, {self.stop})"
@@ -1,57 +1,103 @@
-def compute_keep_segments(captions, candidates, decisions, merge_gap=0.1, min_keep=0.25):
-    if captions:
-        total_duration = max(item["end_sec"] for item in captions)
-    else:
-        total_duration = 0.0
+from bisect import bisect_right
+from itertools import accumulate
+
+
+def compute_keep_segments(
+    captions, candidates, decisions, merge_gap=0.1, min_keep=0.25, total_duration=None
+):
+    if total_duration is None:
+        if hasattr(captions, "duration"):
+            total_duration = captions.duration()
+        elif captions:
+            total_duration = max(item["end_sec"] for item in captions)
+        else:
+            total_duration = 0.0
 
     decision_map = {item["id"]: item for item in decisions}
-    segments = []
-    cursor = 0.0
+    segments = list(
+        iter_keep_segments(candidates, decision_map, merge_gap, min_keep, total_duration)
+    )
+    return segments, total_duration
+
 
+def iter_keep_segments(candidates, decision_map, merge_gap, min_keep, total_duration):
+    # Each stage is a generator that holds back only the segment it may still
+    # extend, so a segment is final as soon as it is yielded.
+    segments = _keep_between_cuts(candidates, decision_map, total_duration)
+    segments = _merge_by_gap(segments, merge_gap)
+    return _enforce_min_length(segments, min_keep)
+
+
+def _keep_between_cuts(candidates, decision_map, total_duration):
+    cursor = 0.0
     for cand in candidates:
         decision = decision_map.get(cand["id"], {}).get("decision", "KEEP")
         if decision == "CUT":
-            if cand["gap_start"] > cursor:
-                segments.append([cursor, cand["gap_start"]])
+            # Captions can run past the end of the video; never keep beyond it.
+            end = min(cand["gap_start"], total_duration)
+            if end > cursor:
+                yield [cursor, end]
             cursor = max(cursor, cand["gap_end"])
 
     if total_duration > cursor:
-        segments.append([cursor, total_duration])
-
-    segments = _merge_by_gap(segments, merge_gap)
-    segments = _enforce_min_length(segments, min_keep)
-
-    return segments, total_duration
+        yield [cursor, total_duration]
 
 
 def _merge_by_gap(segments, gap_threshold):
-    if not segments:
-        return []
-    merged = [segments[0][:]]
-    for start, end in segments[1:]:
-        if start - merged[-1][1] <= gap_threshold:
-            merged[-1][1] = max(merged[-1][1], end)
+    current = None
+    for start, end in segments:
+        if current is None:
+            current = [start, end]
+        elif start - current[1] <= gap_threshold:
+            current[1] = max(current[1], end)
         else:
-            merged.append([start, end])
-    return merged
+            yield current
+            current = [start, end]
+    if current is not None:
+        yield current
 
 
 def _enforce_min_length(segments, min_len):
-    if not segments:
-        return []
-    i = 0
-    while i < len(segments):
-        start, end = segments[i]
-        if end - start >= min_len or len(segments) == 1:
-            i += 1
-            continue
-        if i == 0 and len(segments) > 1:
-            segments[1][0] = start
-            segments.pop(0)
-            continue
-        if i > 0:
-            segments[i - 1][1] = end
-            segments.pop(i)
-            continue
-        i += 1
-    return segments
+    # Only a leading run can leave previous short: it keeps absorbing the next
+    # segment. After that, each short segment extends the one before it.
+    previous = None
+    for start, end in segments:
+        if previous is None:
+            previous = [start, end]
+        elif previous[1] - previous[0] < min_len or end - start < min_len:
+            previous[1] = end
+        else:
+            yield previous
+            previous = [start, end]
+    if previous is not None:
+        yield previous
+
+
+class TimeIndex:
+    def __init__(self, segments):
+        self.starts = [start for start, _ in segments]
+        self.ends = [end for _, end in segments]
+        # offsets[i] is where keep segment i begins in the edited video.
+        self.offsets = [0.0]
+        self.offsets.extend(
+            accumulate(end - start for start, end in zip(self.starts, self.ends))
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def duration(self):
+        return self.offsets[-1]
+
+    def to_edited(self, seconds):
+        # Times inside a cut map to the edited time where the cut happens.
+        index = bisect_right(self.starts, seconds) - 1
+        if index < 0:
+            return 0.0
+        return self.offsets[index] + min(seconds, self.ends[index]) - self.starts[index]
+
+    def to_original(self, seconds):
+        index = bisect_right(self.offsets, seconds, hi=len(self.starts)) - 1
+        if index < 0:
+            return self.starts[0] if self.starts else 0.0
+        return min(self.starts[index] + seconds - self.offsets[index], self.ends[index])
@@ -1,44 +1,132 @@
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from decision_cache import decision_key
+from rate_limiter import RateLimiter, backoff_delay
 
-def _format_context(items):
-    lines = []
-    for item in items:
-        start = f"{item['start_sec']:.3f}"
-        end = f"{item['end_sec']:.3f}"
-        text = item["text"].replace("\n", " ").strip()
-        lines.append(f"{start}-{end} {text}")
-    return lines
 
+_stats_lock = threading.Lock()
 
-def _build_prompt(candidates):
-    lines = []
-    lines.append(
+PROMPT_HEADER = "\n".join(
+    [
         "Decide whether to CUT or KEEP each pause in a lecture video. "
         "Keep pauses that add meaning (emphasis, transition, reflection). "
-        "Cut filler silence."
-    )
-    lines.append(
-        'Respond with JSON only: [{"id":"...","decision":"CUT|KEEP","reason":"short"}]'
+        "Cut filler silence.",
+        'Respond with JSON only: [{"id":"...","decision":"CUT|KEEP","reason":"short"}]',
+        "Each candidate lists the numbered captions before and after its pause.",
+    ]
+)
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _caption_key(item):
+    return (round(item["start_sec"], 3), round(item["end_sec"], 3), item["text"])
+
+
+def _format_caption(number, item):
+    text = item["text"].replace("\n", " ").strip()
+    return f"[{number}] {item['start_sec']:.3f}-{item['end_sec']:.3f} {text}"
+
+
+def _format_refs(numbers):
+    if not numbers:
+        return "(none)"
+    if numbers == list(range(numbers[0], numbers[-1] + 1)) and len(numbers) > 1:
+        return f"{numbers[0]}-{numbers[-1]}"
+    return ",".join(str(number) for number in numbers)
+
+
+def _format_candidate(cand, before, after):
+    return (
+        f"ID: {cand['id']} gap {cand['gap_start']:.3f}-{cand['gap_end']:.3f} "
+        f"({cand['gap_duration']:.3f}s) before: {_format_refs(before)} "
+        f"after: {_format_refs(after)}"
     )
-    lines.append("Candidates:")
+
+
+def _build_prompt(candidates):
+    numbers = {}
+    caption_lines = []
+    candidate_lines = []
     for cand in candidates:
-        lines.append(f"ID: {cand['id']}")
-        lines.append(
-            f"gap_start: {cand['gap_start']:.3f}, gap_end: {cand['gap_end']:.3f}, "
-            f"gap_duration: {cand['gap_duration']:.3f}"
-        )
-        before_lines = _format_context(cand["context_before"])
-        after_lines = _format_context(cand["context_after"])
-        lines.append("context_before:")
-        lines.extend(before_lines or ["(none)"])
-        lines.append("context_after:")
-        lines.extend(after_lines or ["(none)"])
+        refs = []
+        for items in (cand["context_before"], cand["context_after"]):
+            group = []
+            for item in items:
+                key = _caption_key(item)
+                if key not in numbers:
+                    numbers[key] = len(numbers) + 1
+                    caption_lines.append(_format_caption(numbers[key], item))
+                group.append(numbers[key])
+            refs.append(group)
+        candidate_lines.append(_format_candidate(cand, refs[0], refs[1]))
+
+    lines = [PROMPT_HEADER, "Captions:"]
+    lines.extend(caption_lines or ["(none)"])
+    lines.append("Candidates:")
+    lines.extend(candidate_lines)
     return "\n".join(lines)
 
 
+def _candidate_cost(cand, seen):
+    widest_refs = [99998, 99999]
+    cost = estimate_tokens(_format_candidate(cand, widest_refs, widest_refs) + "\n")
+    new_keys = []
+    for items in (cand["context_before"], cand["context_after"]):
+        for item in items:
+            key = _caption_key(item)
+            if key not in seen and key not in new_keys:
+                new_keys.append(key)
+                cost += estimate_tokens(_format_caption(99999, item) + "\n")
+    return cost, new_keys
+
+
+def _pack_batches(candidates, batch_size, token_budget=None):
+    if not token_budget:
+        return [
+            candidates[start : start + batch_size]
+            for start in range(0, len(candidates), batch_size)
+        ]
+
+    base_tokens = estimate_tokens(PROMPT_HEADER + "\nCaptions:\nCandidates:")
+    batches = []
+    batch = []
+    seen = set()
+    used = base_tokens
+    for cand in candidates:
+        cost, new_keys = _candidate_cost(cand, seen)
+        if batch and used + cost > token_budget:
+            batches.append(batch)
+            batch = []
+            seen = set()
+            used = base_tokens
+            cost, new_keys = _candidate_cost(cand, seen)
+        batch.append(cand)
+        seen.update(new_keys)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def count_batches(candidates, batch_size=10, token_budget=None):
+    return len(_pack_batches(candidates, batch_size, token_budget))
+
+
+def _record(stats, **values):
+    if stats is None:
+        return
+    with _stats_lock:
+        for key, value in values.items():
+            stats[key] = stats.get(key, 0) + value
+
+
 def _extract_json(text):
     text = text.strip()
     try:
@@ -55,9 +143,22 @@ def _extract_json(text):
     return None
 
 
+class UnresolvedGapsError(RuntimeError):
+    def __init__(self, gap_ids, resolved=None, error=None):
+        self.gap_ids = list(gap_ids)
+        self.resolved = list(resolved or [])
+        message = "Gemini returned no valid decision after retries for: " + ", ".join(
+            self.gap_ids
+        )
+        if error is not None:
+            message += f" (last error: {type(error).__name__}: {error})"
+        super().__init__(message)
+
+
 def _validate_response(payload, expected_ids):
     if not isinstance(payload, list):
-        return None
+        return {}
+    expected = set(expected_ids)
     by_id = {}
     for item in payload:
         if not isinstance(item, dict):
@@ -65,30 +166,186 @@ def _validate_response(payload, expected_ids):
         gap_id = item.get("id")
         decision = item.get("decision")
         reason = item.get("reason", "")
-        if gap_id in expected_ids and decision in ("CUT", "KEEP"):
+        if gap_id in expected and decision in ("CUT", "KEEP"):
             by_id[gap_id] = {"id": gap_id, "decision": decision, "reason": str(reason)}
-    if set(by_id.keys()) != set(expected_ids):
-        return None
-    return list(by_id.values())
+    return by_id
 
 
-def decide_gaps(candidates, client, batch_size=10, max_retries=2):
-    results = []
-    for start in range(0, len(candidates), batch_size):
-        batch = candidates[start : start + batch_size]
-        expected_ids = [item["id"] for item in batch]
-        prompt = _build_prompt(batch)
-        attempt = 0
-        batch_result = None
-        while attempt <= max_retries:
-            response_text = client.generate_text(prompt)
+def _decide_batch(batch, client, max_retries, rate_limiter, stats=None, trace=None):
+    resolved = {}
+    pending = list(batch)
+    last_error = None
+    usage = {"attempts": 0, "errors": 0, "prompt_tokens": 0, "output_tokens": 0}
+    latencies = []
+    try:
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1))
+            prompt = _build_prompt(pending)
+            rate_limiter.acquire()
+            estimated = estimate_tokens(prompt)
+            _record(stats, llm_calls=1, prompt_tokens=estimated)
+            usage["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                response_text = client.generate_text(prompt)
+            except Exception as exc:
+                last_error = exc
+                usage["errors"] += 1
+                continue
+            finally:
+                latencies.append(round(time.perf_counter() - started, 4))
+            reported = client.last_usage() if hasattr(client, "last_usage") else None
+            reported = reported or {"prompt_tokens": estimated, "output_tokens": 0}
+            usage["prompt_tokens"] += reported["prompt_tokens"]
+            usage["output_tokens"] += reported["output_tokens"]
+            last_error = None
             payload = _extract_json(response_text)
-            batch_result = _validate_response(payload, expected_ids)
-            if batch_result is not None:
-                break
-            attempt += 1
-            time.sleep(0.5)
-        if batch_result is None:
-            raise RuntimeError("Gemini returned invalid JSON after retries.")
+            resolved.update(_validate_response(payload, [item["id"] for item in pending]))
+            pending = [item for item in pending if item["id"] not in resolved]
+            if not pending:
+                return [resolved[item["id"]] for item in batch]
+        # Raised even when the last attempt failed outright, so answers from
+        # earlier attempts and the other batches are kept.
+        raise UnresolvedGapsError(
+            [item["id"] for item in pending],
+            resolved=[resolved[item["id"]] for item in batch if item["id"] in resolved],
+            error=last_error,
+        ) from last_error
+    finally:
+        if trace is not None:
+            trace.record_batch(
+                size=len(batch),
+                unresolved=len(pending),
+                latencies_sec=latencies,
+                **usage,
+            )
+
+
+def decide_gaps(
+    candidates,
+    client,
+    batch_size=10,
+    max_retries=2,
+    concurrency=1,
+    requests_per_minute=None,
+    rate_limiter=None,
+    cache=None,
+    token_budget=None,
+    stats=None,
+    progress=None,
+    trace=None,
+    journal=None,
+    on_decisions=None,
+):
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(requests_per_minute)
+
+    def dispatch(pending, on_batch=None):
+        batches = _pack_batches(pending, batch_size, token_budget)
+        _record(stats, batches=len(batches))
+        return _dispatch_batches(
+            candidates,
+            batches,
+            lambda batch: _decide_batch(
+                batch, client, max_retries, rate_limiter, stats, trace
+            ),
+            concurrency,
+            on_batch,
+            progress,
+        )
+
+    if cache is None and journal is None:
+        return dispatch(candidates, on_batch=on_decisions)
+
+    known = {}
+    if journal is not None:
+        known.update(
+            (cand["id"], journal.replayed[cand["id"]])
+            for cand in candidates
+            if cand["id"] in journal.replayed
+        )
+        _record(stats, journal_replayed=len(known))
+
+    keys = {}
+    if cache is not None:
+        model = getattr(client, "model", "")
+        keys = {
+            cand["id"]: decision_key(model, cand)
+            for cand in candidates
+            if cand["id"] not in known
+        }
+        cached = cache.get_many(keys.values())
+        for gap_id, key in keys.items():
+            if key in cached:
+                hit = cached[key]
+                known[gap_id] = {
+                    "id": gap_id,
+                    "decision": hit["decision"],
+                    "reason": hit["reason"],
+                    "source": "cache",
+                }
+
+    if on_decisions is not None and known:
+        on_decisions(list(known.values()))
+
+    def store(batch_result):
+        if cache is not None:
+            cache.put_many((keys[item["id"]], item) for item in batch_result)
+        if journal is not None:
+            journal.append(batch_result)
+        if on_decisions is not None:
+            on_decisions(batch_result)
+
+    pending = [cand for cand in candidates if cand["id"] not in known]
+    known.update((item["id"], item) for item in dispatch(pending, on_batch=store))
+    return [known[cand["id"]] for cand in candidates]
+
+
+def _dispatch_batches(
+    candidates, batches, decide_batch, concurrency, on_batch=None, progress=None
+):
+    batch_results = [[] for _ in batches]
+    unresolved = []
+    errors = []
+    completed = 0
+
+    def collect(index, run):
+        nonlocal completed
+        try:
+            batch_results[index] = run()
+        except UnresolvedGapsError as exc:
+            batch_results[index] = exc.resolved
+            unresolved.extend(exc.gap_ids)
+            if exc.__cause__ is not None:
+                errors.append(exc.__cause__)
+        if on_batch is not None and batch_results[index]:
+            on_batch(batch_results[index])
+        completed += 1
+        if progress is not None:
+            progress(completed, len(batches))
+
+    if concurrency <= 1 or len(batches) <= 1:
+        for index, batch in enumerate(batches):
+            collect(index, lambda: decide_batch(batch))
+    else:
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, len(batches)))
+        try:
+            futures = {
+                pool.submit(decide_batch, batch): index
+                for index, batch in enumerate(batches)
+            }
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    results = []
+    for batch_result in batch_results:
         results.extend(batch_result)
+    if unresolved:
+        order = {cand["id"]: index for index, cand in enumerate(candidates)}
+        unresolved.sort(key=order.get)
+        error = errors[-1] if errors else None
+        raise UnresolvedGapsError(unresolved, resolved=results, error=error) from error
     return results
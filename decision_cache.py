@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+CACHE_VERSION = 1
+
+
+def decision_key(model, cand):
+    payload = [
+        CACHE_VERSION,
+        model,
+        round(cand["gap_start"], 3),
+        round(cand["gap_end"], 3),
+        [
+            [round(item["start_sec"], 3), round(item["end_sec"], 3), item["text"]]
+            for item in cand["context_before"]
+        ],
+        [
+            [round(item["start_sec"], 3), round(item["end_sec"], 3), item["text"]]
+            for item in cand["context_after"]
+        ],
+    ]
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    def __init__(self, path, max_entries=200000, max_age_days=90):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_sec = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            "key TEXT PRIMARY KEY, decision TEXT NOT NULL, reason TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS decisions_accessed ON decisions (accessed)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, decision, reason FROM decisions WHERE key IN ({marks})",
+                    chunk,
+                ).fetchall()
+                for key, decision, reason in rows:
+                    found[key] = {"decision": decision, "reason": reason}
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE decisions SET accessed = ? WHERE key IN ({marks})",
+                        [now] + chunk,
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, item["decision"], item.get("reason", ""), now, now) for key, item in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO decisions (key, decision, reason, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            if self.max_age_sec:
+                self._conn.execute(
+                    "DELETE FROM decisions WHERE created < ?",
+                    (time.time() - self.max_age_sec,),
+                )
+            if self.max_entries:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM decisions WHERE key IN ("
+                        "SELECT key FROM decisions ORDER BY accessed ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import threading
+
+from decision_cache import decision_key
+
+
+JOURNAL_VERSION = 1
+
+
+def journal_fingerprint(model, candidates):
+    digest = hashlib.sha256(f"{JOURNAL_VERSION}:{model}".encode("utf-8"))
+    for cand in candidates:
+        digest.update(decision_key(model, cand).encode("ascii"))
+    return digest.hexdigest()
+
+
+class DecisionJournal:
+    def __init__(self, path, fingerprint, resume=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fingerprint = fingerprint
+        self.replayed = self._replay() if resume else {}
+        self._lock = threading.Lock()
+        self._rewrite()
+        self._handle = open(path, "a", encoding="utf-8")
+
+    def _replay(self):
+        found = {}
+        try:
+            handle = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return found
+        with handle:
+            try:
+                header = json.loads(handle.readline())
+            except ValueError:
+                return found
+            if header.get("fingerprint") != self.fingerprint:
+                return found
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-write leaves a truncated last line.
+                    break
+                for item in record.get("batch", []):
+                    found[item["id"]] = item
+        return found
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            header = {"version": JOURNAL_VERSION, "fingerprint": self.fingerprint}
+            handle.write(json.dumps(header) + "\n")
+            if self.replayed:
+                handle.write(json.dumps({"batch": list(self.replayed.values())}) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.path)
+
+    def append(self, items):
+        line = json.dumps({"batch": list(items)}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._handle.write(line)
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+    def close(self):
+        with self._lock:
+            self._handle.close()
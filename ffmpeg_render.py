@@ -1,90 +1,1059 @@
+import hashlib
+import json
+import math
+import os
 import shutil
 import subprocess
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 
+from media_probe import probe_has_audio, probe_keyframes, probe_media, probe_video_stream
+from render_cache import piece_key, source_id
 
-def _has_audio(input_path):
-    ffprobe = shutil.which("ffprobe")
-    if not ffprobe:
-        return False
+
+RENDER_MODES = ("reencode", "smart", "copy")
+
+SMART_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+SMART_PIX_FMTS = {"yuv420p", "yuvj420p", "yuv422p", "yuv444p", "yuv420p10le"}
+SMART_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+ANNEXB_FILTERS = {"h264": "h264_mp4toannexb", "hevc": "hevc_mp4toannexb"}
+MIN_COPY_SEC = 1.0
+MIN_CHUNK_SEC = 10.0
+# Above this many segments the graph switches from one trim branch per segment to a
+# single select/aselect pass read from a script file, so argv length and ffmpeg's
+# per-branch frame buffering no longer grow with the cut list.
+FILTER_SCRIPT_THRESHOLD = 100
+SELECT_AUDIO_SAMPLES = 64
+CACHE_GROUP_SEGMENTS = 8
+CACHE_ENCODE_SETTINGS = ["libx264"]
+PREVIEW_HEIGHT = 360
+PREVIEW_SEGMENT_SEC = 4
+PREVIEW_PLAYLIST = "index.m3u8"
+DEFAULT_FRAME_SEC = 0.04
+SNAP_GUARD_SEC = 0.0005
+
+
+def _smart_encoder_args(stream):
+    if stream is None:
+        return None
+    encoder = SMART_ENCODERS.get(stream.get("codec_name"))
+    if encoder is None or stream.get("pix_fmt") not in SMART_PIX_FMTS:
+        return None
+    args = ["-c:v", encoder, "-pix_fmt", stream["pix_fmt"], "-preset", "veryfast"]
+    args += ["-crf", "18"]
+    if encoder == "libx264":
+        profile = SMART_PROFILES.get(stream.get("profile"))
+        if profile is None:
+            return None
+        args += ["-profile:v", profile]
+    return args
+
+
+def _frame_count(start, end, frame_sec, origin):
+    first = math.ceil((start - origin) / frame_sec - 1e-6)
+    last = math.ceil((end - origin) / frame_sec - 1e-6)
+    return max(0, last - first)
+
+
+def _snap_time(t, frame_sec, origin):
+    # Boundaries land just before the frame they start at, so rounding in the
+    # filter expressions can never drop or add that frame.
+    frames = math.ceil((t - origin) / frame_sec - 1e-6)
+    return origin + frames * frame_sec - SNAP_GUARD_SEC
+
+
+def _iter_snapped(segments, frame_sec, origin):
+    # Video pieces and the audio pass must cut at the same times; snapping every
+    # boundary once keeps the per-piece frame counts exact for both.
+    for start, end in segments:
+        start = _snap_time(start, frame_sec, origin)
+        end = _snap_time(end, frame_sec, origin)
+        if end - start > SNAP_GUARD_SEC:
+            yield [start, end]
+
+
+def _snap_segments(segments, frame_sec, origin):
+    return list(_iter_snapped(segments, frame_sec, origin))
+
+
+def _plan_smart_pieces(segments, keyframes, frame_sec):
+    # Each piece is (kind, seek, read_sec, frames), counted on the source frame
+    # grid. Segments are snapped to that grid first, so the frame counts match
+    # the audio pass cut at the same boundaries.
+    key_pts = [pts for pts, _ in keyframes]
+    origin = key_pts[0]
+    pieces = []
+
+    def encode(start, end):
+        frames = _frame_count(start, end, frame_sec, origin)
+        if frames:
+            pieces.append(("encode", start, end - start, frames))
+
+    for start, end in segments:
+        lo = bisect_left(key_pts, start)
+        hi = bisect_left(key_pts, end) - 1
+        if lo > hi or key_pts[hi] - key_pts[lo] < MIN_COPY_SEC:
+            encode(start, end)
+            continue
+        k_in = key_pts[lo]
+        k_out, k_out_dts = keyframes[hi]
+        encode(start, k_in)
+        # Stop reading at the next keyframe's decode timestamp so B-frames of the
+        # following GOP are not copied.
+        frames = _frame_count(k_in, k_out, frame_sec, origin)
+        pieces.append(("copy", k_in, k_out_dts - k_in, frames))
+        encode(k_out, end)
+    return pieces
+
+
+def _write_concat_list(path, files, durations=None):
+    with open(path, "w", encoding="utf-8") as handle:
+        for idx, file_path in enumerate(files):
+            escaped = os.path.abspath(file_path).replace("'", "'\\''")
+            handle.write(f"file '{escaped}'\n")
+            if durations is not None:
+                handle.write(f"duration {durations[idx]:.6f}\n")
+
+
+def _concat_files(ffmpeg, files, output_path, workdir, durations=None, extra_args=()):
+    list_path = os.path.join(workdir, "concat.txt")
+    _write_concat_list(list_path, files, durations)
     command = [
-        ffprobe,
+        ffmpeg,
+        "-nostdin",
         "-v",
         "error",
-        "-select_streams",
-        "a",
-        "-show_entries",
-        "stream=index",
-        "-of",
-        "csv=p=0",
-        input_path,
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_path,
+        "-c",
+        "copy",
+        *extra_args,
+        output_path,
     ]
-    result = subprocess.run(command, capture_output=True, text=True, check=False)
-    return bool(result.stdout.strip())
+    subprocess.run(command, check=True)
 
 
-def render_video(input_path, segments, output_path):
-    ffmpeg = shutil.which("ffmpeg")
-    if not ffmpeg:
-        raise RuntimeError("ffmpeg not found in PATH.")
-    if not segments:
-        raise ValueError("No segments to render.")
-
-    has_audio = _has_audio(input_path)
+def _trim_graph(segments, video=True, audio=True, offset=0.0):
     filter_parts = []
     concat_inputs = []
-
     for idx, (start, end) in enumerate(segments):
-        v_label = f"v{idx}"
+        start -= offset
+        end -= offset
+        if video:
+            filter_parts.append(
+                f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{idx}]"
+            )
+            concat_inputs.append(f"[v{idx}]")
+        if audio:
+            filter_parts.append(
+                f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{idx}]"
+            )
+            concat_inputs.append(f"[a{idx}]")
+    outputs = ("[v]" if video else "") + ("[a]" if audio else "")
+    filter_parts.append(
+        "".join(concat_inputs)
+        + f"concat=n={len(segments)}:v={int(video)}:a={int(audio)}{outputs}"
+    )
+    return ";".join(filter_parts)
+
+
+def _select_expr(segments, offset=0.0):
+    # Balanced if() tree over the sorted segments: ffmpeg evaluates if() lazily, so
+    # each frame costs O(log n) comparisons instead of one term per segment.
+    if len(segments) == 1:
+        start, end = segments[0]
+        return f"gte(t,{start - offset:.6f})*lt(t,{end - offset:.6f})"
+    mid = len(segments) // 2
+    return (
+        f"if(lt(t,{segments[mid][0] - offset:.6f}),"
+        f"{_select_expr(segments[:mid], offset)},"
+        f"{_select_expr(segments[mid:], offset)})"
+    )
+
+
+def _shift_expr(segments, shifts, offset=0.0):
+    # Same tree shape as _select_expr, returning how far the segment holding
+    # t moves back once the cuts before it are removed.
+    if len(segments) == 1:
+        return f"{shifts[0] - offset:.6f}"
+    mid = len(segments) // 2
+    return (
+        f"if(lt(T,{segments[mid][0] - offset:.6f}),"
+        f"{_shift_expr(segments[:mid], shifts[:mid], offset)},"
+        f"{_shift_expr(segments[mid:], shifts[mid:], offset)})"
+    )
+
+
+def _select_graph(segments, video=True, audio=True, offset=0.0):
+    expr = _select_expr(segments, offset)
+    filter_parts = []
+    if video:
+        # Frames keep their own timestamps minus the removed time, so variable
+        # frame rate sources stay in sync with the sample-counted audio.
+        shifts = []
+        kept = 0.0
+        for start, end in segments:
+            shifts.append(start - kept)
+            kept += end - start
+        shift = _shift_expr(segments, shifts, offset)
+        filter_parts.append(f"[0:v]select='{expr}',setpts='(T-({shift}))/TB'[v]")
+    if audio:
+        # Re-chunk audio into small frames so aselect cuts within a few ms.
         filter_parts.append(
-            f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[{v_label}]"
+            f"[0:a]asetnsamples=n={SELECT_AUDIO_SAMPLES},"
+            f"aselect='{expr}',asetpts=N/SR/TB[a]"
+        )
+    return ";\n".join(filter_parts)
+
+
+def _filter_args(
+    segments, script_path, video=True, audio=True, offset=0.0, video_filter=None
+):
+    # With video_filter the cut video is passed through it and labelled [vf].
+    if len(segments) <= FILTER_SCRIPT_THRESHOLD:
+        graph = _trim_graph(segments, video, audio, offset)
+        if video_filter:
+            graph += f";[v]{video_filter}[vf]"
+        return ["-filter_complex", graph]
+    with open(script_path, "w", encoding="utf-8") as handle:
+        handle.write(_select_graph(segments, video, audio, offset))
+        if video_filter:
+            handle.write(f";\n[v]{video_filter}[vf]")
+    return ["-filter_complex_script", script_path]
+
+
+def _render_audio(ffmpeg, input_path, segments, output_path, trace=None):
+    script_path = output_path + ".filter"
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        input_path,
+        *_filter_args(segments, script_path, video=False),
+        "-map",
+        "[a]",
+        "-c:a",
+        "aac",
+        output_path,
+    ]
+    try:
+        _run_ffmpeg(command, trace=trace)
+    finally:
+        if os.path.exists(script_path):
+            os.remove(script_path)
+
+
+def _mux_video_audio(ffmpeg, video_path, audio_path, output_path):
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        video_path,
+        "-i",
+        audio_path,
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        output_path,
+    ]
+    subprocess.run(command, check=True)
+
+
+def _parse_speed(value):
+    try:
+        return float(value.rstrip("x"))
+    except ValueError:
+        return None
+
+
+def _run_ffmpeg(command, progress=None, total_sec=None, trace=None):
+    if trace is None and (progress is None or not total_sec):
+        subprocess.run(command, check=True)
+        return
+    command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    stats = {"frames": None, "fps": None, "speed": None, "out_time_sec": None}
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_ms is also in microseconds despite its name.
+            if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                stats["out_time_sec"] = int(value) / 1e6
+                if progress is not None and total_sec:
+                    progress(min(1.0, stats["out_time_sec"] / total_sec))
+            elif key == "frame" and value.isdigit():
+                stats["frames"] = int(value)
+            elif key == "fps":
+                stats["fps"] = _parse_speed(value)
+            elif key == "speed":
+                stats["speed"] = _parse_speed(value)
+            elif key == "progress" and value == "end" and progress is not None:
+                progress(1.0)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if trace is not None:
+        trace.record_ffmpeg(
+            output=os.path.basename(command[-1]),
+            wall_sec=round(time.perf_counter() - started, 4),
+            returncode=returncode,
+            **stats,
         )
-        concat_inputs.append(f"[{v_label}]")
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def _run_commands(commands, workers, progress=None, durations=None, trace=None):
+    trackers = [None] * len(commands)
+    if progress is not None and durations:
+        total = sum(durations) or 1.0
+        done = [0.0] * len(commands)
+        lock = threading.Lock()
+
+        def tracker(index):
+            def report(fraction):
+                with lock:
+                    done[index] = fraction * durations[index]
+                    progress(sum(done) / total)
+
+            return report
+
+        trackers = [tracker(index) for index in range(len(commands))]
+        durations = list(durations)
+    else:
+        durations = [None] * len(commands)
+
+    if workers <= 1 or len(commands) <= 1:
+        for command, report, duration in zip(commands, trackers, durations):
+            _run_ffmpeg(command, report, duration, trace)
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(commands))) as pool:
+        futures = [
+            pool.submit(_run_ffmpeg, command, report, duration, trace)
+            for command, report, duration in zip(commands, trackers, durations)
+        ]
+        for future in futures:
+            future.result()
+
+
+def _threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _render_smart(
+    ffmpeg,
+    input_path,
+    segments,
+    output_path,
+    has_audio,
+    workers=1,
+    progress=None,
+    trace=None,
+):
+    stream = probe_video_stream(input_path)
+    encoder_args = _smart_encoder_args(stream)
+    keyframes = probe_keyframes(input_path) if encoder_args else []
+    if not encoder_args or not keyframes:
+        return False
+
+    frame_sec, _ = _frame_grid(input_path)
+    pieces = _plan_smart_pieces(segments, keyframes, frame_sec)
+    annexb = ANNEXB_FILTERS[stream["codec_name"]]
+    workdir = tempfile.mkdtemp(prefix="smart_", dir=os.path.dirname(output_path) or ".")
+    threads = _threads_per_worker(workers)
+    try:
+        files = []
+        durations = []
+        commands = []
+        for idx, (kind, seek, read_sec, frames) in enumerate(pieces):
+            piece_path = os.path.join(workdir, f"piece_{idx:05d}.mkv")
+            command = [ffmpeg, "-nostdin", "-v", "error", "-y", "-ss", f"{seek}"]
+            command += ["-i", input_path, "-t", f"{read_sec}", "-map", "0:v:0"]
+            if kind == "copy":
+                command += ["-c:v", "copy", "-bsf:v", annexb]
+            else:
+                command += ["-frames:v", str(frames)]
+                command += encoder_args + ["-threads", str(threads)]
+                command += ["-bsf:v", "dump_extra=freq=keyframe"]
+            command += ["-avoid_negative_ts", "make_zero", piece_path]
+            commands.append(command)
+            files.append(piece_path)
+            durations.append(frames * frame_sec)
+        _run_commands(commands, workers, progress, durations, trace)
+
+        video_path = os.path.join(workdir, "video.mp4")
+        _concat_files(ffmpeg, files, video_path, workdir, durations=durations)
+        if not has_audio:
+            shutil.move(video_path, output_path)
+            return True
+
+        audio_path = os.path.join(workdir, "audio.m4a")
+        _render_audio(ffmpeg, input_path, segments, audio_path, trace)
+        _mux_video_audio(ffmpeg, video_path, audio_path, output_path)
+        return True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _copy_ranges(segments, key_pts):
+    # Stream copy can only start on a keyframe. Moving each start back to one up
+    # front lets ranges that would overlap once copied be merged instead of
+    # repeating the shared GOP.
+    ranges = []
+    for start, end in segments:
+        idx = bisect_right(key_pts, start + 1e-6) - 1
+        if idx >= 0:
+            start = key_pts[idx]
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def _render_copy(
+    ffmpeg, input_path, segments, output_path, has_audio, progress=None, trace=None
+):
+    key_pts = [pts for pts, _ in probe_keyframes(input_path)]
+    segments = _copy_ranges(segments, key_pts)
+    workdir = tempfile.mkdtemp(prefix="copy_", dir=os.path.dirname(output_path) or ".")
+    try:
+        files = []
+        commands = []
+        for idx, (start, end) in enumerate(segments):
+            piece_path = os.path.join(workdir, f"piece_{idx:05d}.mkv")
+            command = [ffmpeg, "-nostdin", "-v", "error", "-y", "-ss", f"{start}"]
+            command += ["-i", input_path, "-t", f"{end - start}", "-map", "0:v:0"]
+            if has_audio:
+                command += ["-map", "0:a:0"]
+            command += ["-c", "copy", "-avoid_negative_ts", "make_zero", piece_path]
+            commands.append(command)
+            files.append(piece_path)
+        _run_commands(
+            commands, 1, progress, [end - start for start, end in segments], trace
+        )
+        _concat_files(
+            ffmpeg,
+            files,
+            output_path,
+            workdir,
+            extra_args=("-movflags", "+faststart"),
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _split_into_chunks(segments, chunk_count, frame_sec, origin):
+    total = sum(end - start for start, end in segments)
+    target = total / chunk_count
+    chunks = [[]]
+    filled = 0.0
+    for start, end in segments:
+        while len(chunks) < chunk_count and filled + (end - start) > target:
+            cut = start + (target - filled)
+            cut = origin + round((cut - origin) / frame_sec) * frame_sec
+            if start < cut < end:
+                chunks[-1].append([start, cut])
+                start = cut
+            elif not chunks[-1]:
+                break
+            chunks.append([])
+            filled = 0.0
+        if end > start:
+            chunks[-1].append([start, end])
+            filled += end - start
+    return [chunk for chunk in chunks if chunk]
+
+
+def _chunk_command(ffmpeg, input_path, chunk, piece_path, threads):
+    # Seek to the chunk so each worker only decodes its own part of the source.
+    offset = chunk[0][0]
+    return [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-ss",
+        f"{offset}",
+        "-t",
+        f"{chunk[-1][1] - offset}",
+        "-i",
+        input_path,
+        "-filter_threads",
+        str(threads),
+        *_filter_args(chunk, piece_path + ".filter", audio=False, offset=offset),
+        "-map",
+        "[v]",
+        "-c:v",
+        "libx264",
+        "-threads",
+        str(threads),
+        piece_path,
+    ]
+
+
+def _frame_grid(input_path):
+    info = probe_media(input_path)
+    if info is None or info["video"] is None:
+        return DEFAULT_FRAME_SEC, 0.0
+    try:
+        origin = float(info["video"].get("start_time") or 0.0)
+    except ValueError:
+        origin = 0.0
+    rate = info["frame_rate"]
+    return (1.0 / rate if rate else DEFAULT_FRAME_SEC), origin
+
+
+def _encode_and_assemble(
+    ffmpeg,
+    input_path,
+    segments,
+    output_path,
+    has_audio,
+    workdir,
+    files,
+    durations,
+    commands,
+    command_durations,
+    workers,
+    progress=None,
+    trace=None,
+):
+    audio_path = os.path.join(workdir, "audio.m4a")
+    with ThreadPoolExecutor(max_workers=1) as audio_pool:
+        audio_job = None
         if has_audio:
-            a_label = f"a{idx}"
-            filter_parts.append(
-                f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[{a_label}]"
+            audio_job = audio_pool.submit(
+                _render_audio, ffmpeg, input_path, segments, audio_path, trace
             )
-            concat_inputs.append(f"[{a_label}]")
+        _run_commands(commands, workers, progress, command_durations, trace)
+        if audio_job is not None:
+            audio_job.result()
 
-    if has_audio:
-        concat_filter = (
-            "".join(concat_inputs)
-            + f"concat=n={len(segments)}:v=1:a=1[v][a]"
+    _assemble(
+        ffmpeg, files, durations, audio_path if has_audio else None, output_path, workdir
+    )
+
+
+def _assemble(ffmpeg, files, durations, audio_path, output_path, workdir):
+    video_path = os.path.join(workdir, "video.mp4")
+    _concat_files(ffmpeg, files, video_path, workdir, durations=durations)
+    if audio_path is not None:
+        _mux_video_audio(ffmpeg, video_path, audio_path, output_path)
+    else:
+        _concat_files(
+            ffmpeg,
+            [video_path],
+            output_path,
+            workdir,
+            extra_args=("-movflags", "+faststart"),
         )
-        filter_parts.append(concat_filter)
-        command = [
+
+
+def _render_chunked(
+    ffmpeg,
+    input_path,
+    segments,
+    output_path,
+    has_audio,
+    workers,
+    progress=None,
+    trace=None,
+):
+    stream = probe_video_stream(input_path)
+    if stream is None:
+        return False
+    frame_sec, origin = _frame_grid(input_path)
+    total = sum(end - start for start, end in segments)
+    chunk_count = min(workers, int(total // MIN_CHUNK_SEC))
+    if chunk_count < 2:
+        return False
+    chunks = _split_into_chunks(segments, chunk_count, frame_sec, origin)
+    if len(chunks) < 2:
+        return False
+
+    threads = _threads_per_worker(workers)
+    workdir = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(output_path) or ".")
+    try:
+        files = []
+        durations = []
+        commands = []
+        for idx, chunk in enumerate(chunks):
+            piece_path = os.path.join(workdir, f"chunk_{idx:03d}.mkv")
+            commands.append(_chunk_command(ffmpeg, input_path, chunk, piece_path, threads))
+            files.append(piece_path)
+            frames = sum(
+                _frame_count(start, end, frame_sec, origin) for start, end in chunk
+            )
+            durations.append(frames * frame_sec)
+
+        _encode_and_assemble(
             ffmpeg,
-            "-y",
-            "-i",
             input_path,
-            "-filter_complex",
-            ";".join(filter_parts),
-            "-map",
-            "[v]",
-            "-map",
-            "[a]",
-            "-movflags",
-            "+faststart",
+            segments,
             output_path,
-        ]
-    else:
-        concat_filter = (
-            "".join(concat_inputs)
-            + f"concat=n={len(segments)}:v=1:a=0[v]"
+            has_audio,
+            workdir,
+            files,
+            durations,
+            commands,
+            durations,
+            workers,
+            progress,
+            trace,
         )
-        filter_parts.append(concat_filter)
-        command = [
+        return True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _iter_groups(segments, average=CACHE_GROUP_SEGMENTS):
+    # Group boundaries depend only on each segment's own end time, so changing one
+    # decision regroups just its neighbourhood and later pieces keep their keys.
+    group = []
+    for start, end in segments:
+        group.append([start, end])
+        digest = hashlib.sha1(f"{end:.3f}".encode("ascii")).digest()
+        if digest[0] % average == 0 or len(group) >= average * 4:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def _group_segments(segments, average=CACHE_GROUP_SEGMENTS):
+    return list(_iter_groups(segments, average))
+
+
+def _render_cached(
+    ffmpeg,
+    input_path,
+    segments,
+    output_path,
+    has_audio,
+    workers,
+    cache,
+    progress=None,
+    trace=None,
+):
+    stream = probe_video_stream(input_path)
+    if stream is None:
+        return False
+    frame_sec, origin = _frame_grid(input_path)
+    source = source_id(input_path)
+    threads = _threads_per_worker(workers)
+    workdir = tempfile.mkdtemp(prefix="cached_", dir=os.path.dirname(output_path) or ".")
+    try:
+        files = []
+        durations = []
+        keys = []
+        commands = []
+        missing = []
+        for idx, group in enumerate(_group_segments(segments)):
+            piece_path = os.path.join(workdir, f"piece_{idx:05d}.mkv")
+            key = piece_key(source, group, CACHE_ENCODE_SETTINGS)
+            frames = sum(
+                _frame_count(start, end, frame_sec, origin) for start, end in group
+            )
+            files.append(piece_path)
+            durations.append(frames * frame_sec)
+            keys.append(key)
+            if not cache.fetch(key, piece_path):
+                commands.append(
+                    _chunk_command(ffmpeg, input_path, group, piece_path, threads)
+                )
+                missing.append(idx)
+
+        _encode_and_assemble(
             ffmpeg,
-            "-y",
-            "-i",
             input_path,
-            "-filter_complex",
-            ";".join(filter_parts),
-            "-map",
-            "[v]",
-            "-movflags",
-            "+faststart",
+            segments,
             output_path,
-        ]
+            has_audio,
+            workdir,
+            files,
+            durations,
+            commands,
+            [durations[idx] for idx in missing],
+            workers,
+            progress,
+            trace,
+        )
+        for idx in missing:
+            cache.store(keys[idx], files[idx])
+        cache.evict(keep=keys)
+        return True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
-    subprocess.run(command, check=True)
+
+def _render_reencode(
+    ffmpeg, input_path, segments, output_path, has_audio, progress=None, trace=None
+):
+    handle, script_path = tempfile.mkstemp(
+        prefix="filter_", suffix=".txt", dir=os.path.dirname(output_path) or "."
+    )
+    os.close(handle)
+    command = [
+        ffmpeg,
+        "-y",
+        "-i",
+        input_path,
+        *_filter_args(segments, script_path, audio=has_audio),
+        "-map",
+        "[v]",
+    ]
+    if has_audio:
+        command += ["-map", "[a]"]
+    command += ["-movflags", "+faststart", output_path]
+    try:
+        _run_ffmpeg(
+            command, progress, sum(end - start for start, end in segments), trace
+        )
+    finally:
+        os.remove(script_path)
+
+
+def render_video(
+    input_path,
+    segments,
+    output_path,
+    mode="reencode",
+    workers=1,
+    progress=None,
+    cache=None,
+    trace=None,
+):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    if not segments:
+        raise ValueError("No segments to render.")
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: {mode}")
+
+    has_audio = probe_has_audio(input_path)
+    if mode == "copy":
+        _render_copy(
+            ffmpeg, input_path, segments, output_path, has_audio, progress, trace
+        )
+        return "copy"
+    if probe_video_stream(input_path) is not None:
+        segments = _snap_segments(segments, *_frame_grid(input_path))
+        if not segments:
+            raise ValueError("No segments to render.")
+    if mode == "smart":
+        try:
+            if _render_smart(
+                ffmpeg,
+                input_path,
+                segments,
+                output_path,
+                has_audio,
+                workers,
+                progress,
+                trace,
+            ):
+                return "smart"
+        except subprocess.CalledProcessError:
+            pass
+    if cache is not None and _render_cached(
+        ffmpeg,
+        input_path,
+        segments,
+        output_path,
+        has_audio,
+        workers,
+        cache,
+        progress,
+        trace,
+    ):
+        return "reencode"
+    if workers > 1 and _render_chunked(
+        ffmpeg, input_path, segments, output_path, has_audio, workers, progress, trace
+    ):
+        return "reencode"
+    _render_reencode(
+        ffmpeg, input_path, segments, output_path, has_audio, progress, trace
+    )
+    return "reencode"
+
+
+def _encode_piece(ffmpeg, input_path, group, piece_path, threads, cache, key, trace):
+    _run_ffmpeg(
+        _chunk_command(ffmpeg, input_path, group, piece_path, threads), trace=trace
+    )
+    if cache is not None:
+        cache.store(key, piece_path)
+
+
+def render_segment_stream(
+    input_path, segments, output_path, workers=1, cache=None, trace=None
+):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    stream = probe_video_stream(input_path)
+    if stream is None:
+        return render_video(
+            input_path, list(segments), output_path, workers=workers, cache=cache, trace=trace
+        )
+
+    has_audio = probe_has_audio(input_path)
+    frame_sec, origin = _frame_grid(input_path)
+    source = source_id(input_path) if cache is not None else None
+    threads = _threads_per_worker(workers)
+    workdir = tempfile.mkdtemp(prefix="stream_", dir=os.path.dirname(output_path) or ".")
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        kept = []
+        files = []
+        durations = []
+        keys = []
+        jobs = []
+        # Segments arrive as they become final; each closed group is encoded
+        # while later parts of the plan are still being decided.
+        snapped = _iter_snapped(segments, frame_sec, origin)
+        for idx, group in enumerate(_iter_groups(snapped)):
+            kept.extend(group)
+            piece_path = os.path.join(workdir, f"piece_{idx:05d}.mkv")
+            frames = sum(
+                _frame_count(start, end, frame_sec, origin) for start, end in group
+            )
+            files.append(piece_path)
+            durations.append(frames * frame_sec)
+            key = None
+            if cache is not None:
+                key = piece_key(source, group, CACHE_ENCODE_SETTINGS)
+                keys.append(key)
+                if cache.fetch(key, piece_path):
+                    continue
+            jobs.append(
+                pool.submit(
+                    _encode_piece,
+                    ffmpeg,
+                    input_path,
+                    group,
+                    piece_path,
+                    threads,
+                    cache,
+                    key,
+                    trace,
+                )
+            )
+        if not kept:
+            raise ValueError("No segments to render.")
+
+        audio_path = None
+        if has_audio:
+            audio_path = os.path.join(workdir, "audio.m4a")
+            _render_audio(ffmpeg, input_path, kept, audio_path, trace)
+        for job in jobs:
+            job.result()
+        _assemble(ffmpeg, files, durations, audio_path, output_path, workdir)
+        if cache is not None:
+            cache.evict(keep=keys)
+        return "reencode"
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def proxy_path(input_path, proxy_dir, height=PREVIEW_HEIGHT):
+    key = hashlib.sha1(json.dumps([source_id(input_path), height]).encode("ascii"))
+    return os.path.join(proxy_dir, f"{key.hexdigest()}.mp4")
+
+
+def evict_proxies(proxy_dir, max_bytes, keep=()):
+    # Least recently used first; make_proxy refreshes the mtime on every use.
+    # Proxies of deleted sources are never used again, so they age out too.
+    entries = []
+    total = 0
+    try:
+        scan = list(os.scandir(proxy_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in scan:
+        if entry.name.startswith("proxy_") or not entry.name.endswith(".mp4"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        total += stat.st_size
+        if entry.path not in keep:
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def make_proxy(
+    input_path, proxy_dir, height=PREVIEW_HEIGHT, max_bytes=None, trace=None
+):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    proxy = proxy_path(input_path, proxy_dir, height)
+    if os.path.isfile(proxy):
+        os.utime(proxy)
+        return proxy
+
+    os.makedirs(proxy_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(prefix="proxy_", suffix=".mp4", dir=proxy_dir)
+    os.close(handle)
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        input_path,
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-vf",
+        f"scale=-2:{height}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-crf",
+        "30",
+        # A keyframe every second keeps later trims cheap to seek.
+        "-force_key_frames",
+        "expr:gte(t,n_forced)",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "96k",
+        tmp_path,
+    ]
+    try:
+        _run_ffmpeg(command, trace=trace)
+        os.replace(tmp_path, proxy)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if max_bytes:
+        evict_proxies(proxy_dir, max_bytes, keep=(proxy,))
+    return proxy
+
+
+def render_preview(
+    input_path,
+    segments,
+    output_dir,
+    height=PREVIEW_HEIGHT,
+    proxy_dir=None,
+    progress=None,
+    trace=None,
+):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH.")
+    if not segments:
+        raise ValueError("No segments to render.")
+
+    # A proxy is only used once it exists: building one means transcoding the
+    # whole source, which would hold back the first playlist segment.
+    source = input_path
+    video_filter = f"scale=-2:{height}"
+    if proxy_dir and os.path.isfile(proxy_path(input_path, proxy_dir, height)):
+        source = make_proxy(input_path, proxy_dir, height, trace=trace)
+        video_filter = None
+    has_audio = probe_has_audio(source)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name.endswith((".ts", ".m3u8")):
+            os.remove(os.path.join(output_dir, name))
+    script_path = os.path.join(output_dir, "preview.filter")
+    playlist_path = os.path.join(output_dir, PREVIEW_PLAYLIST)
+    command = [
+        ffmpeg,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        source,
+        *_filter_args(
+            segments, script_path, audio=has_audio, video_filter=video_filter
+        ),
+        "-map",
+        "[vf]" if video_filter else "[v]",
+    ]
+    if has_audio:
+        command += ["-map", "[a]", "-c:a", "aac", "-b:a", "96k"]
+    command += [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-crf",
+        "30",
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{PREVIEW_SEGMENT_SEC})",
+        "-f",
+        "hls",
+        "-hls_time",
+        str(PREVIEW_SEGMENT_SEC),
+        # An event playlist grows as segments finish, so playback can start
+        # before the encode does.
+        "-hls_playlist_type",
+        "event",
+        "-hls_flags",
+        "independent_segments+temp_file",
+        "-hls_segment_filename",
+        os.path.join(output_dir, "segment_%05d.ts"),
+        playlist_path,
+    ]
+    try:
+        _run_ffmpeg(
+            command, progress, sum(end - start for start, end in segments), trace
+        )
+    finally:
+        if os.path.exists(script_path):
+            os.remove(script_path)
+    return playlist_path
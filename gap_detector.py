@@ -1,25 +1,33 @@
+import numpy as np
+
+from caption_table import CaptionTable
+
+
 def detect_gaps(captions, min_gap=0.8, context=2):
-    candidates = []
-    if not captions:
-        return candidates
+    table = CaptionTable.from_captions(captions)
+    context = max(context, 0)
+    total = len(table)
+    if total < 2:
+        return []
+
+    gaps = table.start[1:] - table.end[:-1]
+    indices = np.flatnonzero(gaps >= min_gap)
 
-    for i in range(len(captions) - 1):
-        current = captions[i]
-        next_cap = captions[i + 1]
-        gap = next_cap["start_sec"] - current["end_sec"]
-        if gap >= min_gap:
-            before_start = max(0, i - context + 1)
-            after_end = min(len(captions), i + 1 + context)
-            context_before = captions[before_start : i + 1]
-            context_after = captions[i + 1 : after_end]
-            candidates.append(
-                {
-                    "id": f"gap_{i}",
-                    "gap_start": current["end_sec"],
-                    "gap_end": next_cap["start_sec"],
-                    "gap_duration": gap,
-                    "context_before": context_before,
-                    "context_after": context_after,
-                }
-            )
+    candidates = []
+    for i, gap_start, gap_end, gap in zip(
+        indices.tolist(),
+        table.end[indices].tolist(),
+        table.start[indices + 1].tolist(),
+        gaps[indices].tolist(),
+    ):
+        candidates.append(
+            {
+                "id": f"gap_{i}",
+                "gap_start": gap_start,
+                "gap_end": gap_end,
+                "gap_duration": gap,
+                "context_before": table.slice(max(0, i - context + 1), i + 1),
+                "context_after": table.slice(i + 1, min(total, i + 1 + context)),
+            }
+        )
     return candidates
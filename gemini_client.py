@@ -1,4 +1,5 @@
 import os
+import threading
 
 from google import genai
 
@@ -12,9 +13,18 @@ class GeminiClient:
         if not os.environ.get("GEMINI_API_KEY"):
             os.environ["GEMINI_API_KEY"] = key
         self.client = genai.Client()
+        self._local = threading.local()
 
     def generate_text(self, prompt):
         response = self.client.models.generate_content(
             model=self.model, contents=prompt
         )
+        usage = getattr(response, "usage_metadata", None)
+        self._local.usage = {
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        }
         return response.text or ""
+
+    def last_usage(self):
+        return getattr(self._local, "usage", None)
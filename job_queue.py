@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+FINISHED_STATUSES = ("done", "error")
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class JobQueue:
+    def __init__(self, workers=2, max_pending=16, keep_finished=200):
+        self.max_pending = max(1, max_pending)
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="job"
+        )
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+        self._active = 0
+
+    def submit(self, job_id, func, *args, **kwargs):
+        with self._changed:
+            if self._active >= self.max_pending:
+                raise QueueFullError("Too many jobs in progress, try again later.")
+            self._active += 1
+            now = time.time()
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "stage": "queued",
+                "progress": 0.0,
+                "result": None,
+                "error": None,
+                "created": now,
+                "updated": now,
+                "version": 0,
+            }
+            self._trim()
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return self.get(job_id)
+
+    def _run(self, job_id, func, args, kwargs):
+        self.update(job_id, status="running")
+
+        def progress(stage, fraction=0.0):
+            self.update(job_id, stage=stage, progress=round(min(1.0, fraction), 3))
+
+        try:
+            result = func(*args, progress=progress, **kwargs)
+        except Exception as exc:
+            self.update(job_id, status="error", error=str(exc))
+        else:
+            self.update(job_id, status="done", stage="done", progress=1.0, result=result)
+        finally:
+            with self._changed:
+                self._active -= 1
+
+    def update(self, job_id, **fields):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["updated"] = time.time()
+            job["version"] += 1
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id, version, timeout=None):
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._jobs.get(job_id, {}).get("version") != version, timeout
+            )
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def counts(self):
+        with self._changed:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+    def _trim(self):
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATUSES
+        ]
+        for job_id in finished[: max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,149 @@
+import json
+import math
+
+
+SENTENCE_END = (".", "!", "?", "…")
+CONNECTORS = frozenset(
+    "a an and as at because but by for from if in of on or so than that the then "
+    "to which while with".split()
+)
+FEATURES = (
+    "duration",
+    "log_duration",
+    "ends_sentence",
+    "ends_question",
+    "ends_clause",
+    "ends_connector",
+    "after_lowercase",
+    "after_connector",
+)
+DEFAULT_THRESHOLD = 0.9
+
+
+def check_threshold(threshold):
+    if not 0.5 < threshold <= 1.0:
+        raise ValueError("Local decider threshold must be above 0.5 and at most 1.0.")
+    return threshold
+
+
+def _words(text):
+    return text.replace("\n", " ").split()
+
+
+def _last_text(items):
+    return items[-1]["text"].strip() if len(items) else ""
+
+
+def _first_text(items):
+    return items[0]["text"].strip() if len(items) else ""
+
+
+def gap_features(cand):
+    before = _last_text(cand["context_before"])
+    after = _first_text(cand["context_after"])
+    before_words = _words(before)
+    after_words = _words(after)
+    last_word = before_words[-1].lower().strip("\"')") if before_words else ""
+    first_word = after_words[0].lower().strip("\"'(") if after_words else ""
+    duration = float(cand["gap_duration"])
+    return {
+        "duration": duration,
+        "log_duration": math.log1p(max(0.0, duration)),
+        "ends_sentence": float(before.rstrip("\"')").endswith(SENTENCE_END)),
+        "ends_question": float(before.rstrip("\"')").endswith("?")),
+        "ends_clause": float(before.endswith((",", ";", ":", "-"))),
+        "ends_connector": float(last_word in CONNECTORS),
+        "after_lowercase": float(after[:1].islower()),
+        "after_connector": float(first_word in CONNECTORS),
+    }
+
+
+def load_model(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        try:
+            model = json.load(handle)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Local model {path} is not valid JSON: {exc}") from None
+    weights = model.get("weights") if isinstance(model, dict) else None
+    if not isinstance(weights, dict):
+        raise ValueError(f"Local model {path} needs a weights object.")
+    unknown = sorted(set(weights) - set(FEATURES))
+    if unknown:
+        raise ValueError(f"Local model {path} has unknown features: {', '.join(unknown)}")
+    try:
+        return {
+            "bias": float(model.get("bias", 0.0)),
+            "weights": {name: float(value) for name, value in weights.items()},
+        }
+    except (TypeError, ValueError):
+        raise ValueError(f"Local model {path} has a non-numeric bias or weight.") from None
+
+
+class LocalScorer:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, model=None, long_gap=5.0, dead_air=10.0):
+        self.threshold = check_threshold(threshold)
+        self.model = model
+        self.long_gap = long_gap
+        self.dead_air = dead_air
+
+    def score(self, cand):
+        features = gap_features(cand)
+        if self.model is not None:
+            total = self.model["bias"] + sum(
+                weight * features[name] for name, weight in self.model["weights"].items()
+            )
+            return 1.0 / (1.0 + math.exp(-max(-60.0, min(60.0, total)))), "local model"
+        return self._rule_score(features)
+
+    def _rule_score(self, features):
+        duration = features["duration"]
+        mid_sentence = not features["ends_sentence"] and (
+            features["ends_clause"]
+            or features["ends_connector"]
+            or features["after_lowercase"]
+            or features["after_connector"]
+        )
+        if features["ends_question"] and duration < 1.5:
+            return 0.05, "short pause after a question"
+        if mid_sentence and duration >= self.long_gap:
+            return 0.97, "long dead air in the middle of a sentence"
+        if duration >= self.dead_air:
+            return 0.95, "very long dead air"
+        return 0.5, ""
+
+    def split(self, candidates):
+        decided = []
+        ambiguous = []
+        for cand in candidates:
+            p_cut, reason = self.score(cand)
+            if p_cut >= self.threshold:
+                decision = "CUT"
+            elif p_cut <= 1.0 - self.threshold:
+                decision = "KEEP"
+            else:
+                ambiguous.append(cand)
+                continue
+            decided.append(
+                {
+                    "id": cand["id"],
+                    "decision": decision,
+                    "reason": reason,
+                    "confidence": round(max(p_cut, 1.0 - p_cut), 3),
+                }
+            )
+        return decided, ambiguous
+
+
+def apply_decisions(candidates, decisions, audio_kept=()):
+    decisions_by_id = {item["id"]: item for item in decisions}
+    for cand in candidates:
+        decision = decisions_by_id.get(cand["id"], {"decision": "KEEP", "reason": ""})
+        cand["decision"] = decision["decision"]
+        cand["reason"] = decision.get("reason", "")
+        if "confidence" in decision:
+            cand["decision_source"] = "local"
+            cand["local_confidence"] = decision["confidence"]
+        else:
+            cand["decision_source"] = decision.get("source", "gemini")
+    for cand in audio_kept:
+        cand["decision_source"] = "audio"
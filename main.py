@@ -1,60 +1,137 @@
 import argparse
-import csv
-import json
 import os
 import sys
 
-from cutter import compute_keep_segments
-from decider import decide_gaps
-from ffmpeg_render import render_video
-from gap_detector import detect_gaps
-from gemini_client import GeminiClient
+from batch import batch_main
+from decision_cache import DecisionCache
+from ffmpeg_render import RENDER_MODES, render_video
+from metrics import Trace
+from pipeline import (
+    add_pipeline_args,
+    add_render_cache_args,
+    open_local_scorer,
+    open_render_cache,
+    plan_video,
+    render_plan,
+    start_stream_render,
+    write_keep_csv,
+)
+from plan_io import load_cut_plan, save_cut_plan
+from replan import parse_overrides, replan_cut_plan
+from subtitles import write_edited_subtitles
 from transcript_parser import parse_transcript
 
 
-def write_cut_plan(path, data):
-    with open(path, "w", encoding="utf-8") as handle:
-        json.dump(data, handle, indent=2)
-
-
-def write_keep_csv(path, segments):
-    with open(path, "w", encoding="utf-8", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["start_sec", "end_sec", "duration_sec"])
-        for start, end in segments:
-            writer.writerow([f"{start:.3f}", f"{end:.3f}", f"{(end - start):.3f}"])
-
-
 def build_arg_parser():
     parser = argparse.ArgumentParser(description="AI-powered silence cutter")
     parser.add_argument("--video", required=True, help="Input MP4 video file")
     parser.add_argument("--transcript", required=True, help="Transcript file (SRT/VTT)")
     parser.add_argument("--outdir", default="outputs", help="Output directory")
-    parser.add_argument("--min-gap", type=float, default=0.8, help="Min gap to consider")
-    parser.add_argument("--context", type=int, default=2, help="Captions before/after")
-    parser.add_argument("--batch-size", type=int, default=10, help="Gemini batch size")
+    add_pipeline_args(parser)
+    return parser
+
+
+def build_replan_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py replan",
+        description="Rebuild keep segments from an existing cut plan without calling Gemini",
+    )
+    parser.add_argument(
+        "plan", help="cut_plan.jsonl (or .jsonl.gz, or an older cut_plan.json) from a previous run"
+    )
     parser.add_argument(
-        "--min-keep", type=float, default=0.25, help="Minimum keep segment length"
+        "--outdir", default=None, help="Output directory (default: the plan's directory)"
     )
     parser.add_argument(
-        "--render",
-        dest="render",
-        action="store_true",
-        help="Render edited video with ffmpeg (default)",
+        "--min-keep", type=float, default=None, help="Minimum keep segment length"
     )
     parser.add_argument(
-        "--no-render",
-        dest="render",
-        action="store_false",
-        help="Skip video rendering",
+        "--merge-gap",
+        type=float,
+        default=None,
+        help="Merge keep segments separated by at most this many seconds",
     )
-    parser.set_defaults(render=True)
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        action="append",
+        default=[],
+        metavar="GAP_ID=CUT|KEEP",
+        help="Override one gap decision (repeatable)",
+    )
+    parser.add_argument(
+        "--video", default=None, help="Source video (default: the one in the plan)"
+    )
+    parser.add_argument(
+        "--render", action="store_true", help="Render the edited video with ffmpeg"
+    )
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default="reencode")
+    parser.add_argument("--render-workers", type=int, default=1)
+    add_render_cache_args(parser)
     return parser
 
 
-def main():
+def replan_main(argv):
+    args = build_replan_parser().parse_args(argv)
+    if not os.path.isfile(args.plan):
+        print(f"Cut plan not found: {args.plan}", file=sys.stderr)
+        return 1
+
+    try:
+        plan, keep_segments = replan_cut_plan(
+            load_cut_plan(args.plan),
+            overrides=parse_overrides(args.overrides),
+            merge_gap=args.merge_gap,
+            min_keep=args.min_keep,
+        )
+    except ValueError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+    outdir = args.outdir or os.path.dirname(os.path.abspath(args.plan))
+    os.makedirs(outdir, exist_ok=True)
+    save_cut_plan(outdir, plan, compress=args.plan.endswith(".gz"))
+    write_keep_csv(os.path.join(outdir, "keep_segments.csv"), keep_segments)
+    if os.path.isfile(plan.get("transcript") or ""):
+        write_edited_subtitles(outdir, parse_transcript(plan["transcript"]), keep_segments)
+
+    edited_path = os.path.join(outdir, "edited.mp4")
+    rendered = None
+    if args.render and keep_segments:
+        try:
+            rendered = render_video(
+                args.video or plan["video"],
+                keep_segments,
+                edited_path,
+                mode=args.render_mode,
+                workers=args.render_workers,
+                cache=open_render_cache(args),
+            )
+        except Exception as exc:
+            print(f"Render skipped: {exc}", file=sys.stderr)
+
+    candidates = plan.get("candidates", [])
+    print(
+        f"Decisions: CUT={sum(1 for c in candidates if c.get('decision') == 'CUT')} "
+        f"KEEP={sum(1 for c in candidates if c.get('decision') == 'KEEP')} "
+        f"(overridden: {sum(1 for c in candidates if 'original_decision' in c)})"
+    )
+    print(f"Keep segments: {len(keep_segments)}")
+    print(f"Estimated edited duration: {plan['estimated_edited_duration_sec']:.2f}s")
+    if rendered:
+        print(f"Edited video: {edited_path} ({rendered})")
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "replan":
+        return replan_main(argv[1:])
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+
     parser = build_arg_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if not os.path.isfile(args.video):
         print(f"Video not found: {args.video}", file=sys.stderr)
@@ -62,74 +139,114 @@ def main():
     if not os.path.isfile(args.transcript):
         print(f"Transcript not found: {args.transcript}", file=sys.stderr)
         return 1
+    if args.local_model and not os.path.isfile(args.local_model):
+        print(f"Local model not found: {args.local_model}", file=sys.stderr)
+        return 1
+    try:
+        open_local_scorer(args)
+    except (OSError, ValueError) as exc:
+        print(f"Could not load local model: {exc}", file=sys.stderr)
+        return 1
 
     os.makedirs(args.outdir, exist_ok=True)
+    trace = Trace()
 
-    captions = parse_transcript(args.transcript)
-    candidates = detect_gaps(captions, min_gap=args.min_gap, context=args.context)
-
-    decisions = []
-    if candidates:
-        client = GeminiClient()
-        decisions = decide_gaps(
-            candidates, client, batch_size=args.batch_size, max_retries=2
+    cache = None
+    cache_stats = None
+    if args.use_decision_cache:
+        cache_path = args.decision_cache or os.path.join(
+            args.outdir, ".cache", "decisions.sqlite"
         )
-
-    decisions_by_id = {item["id"]: item for item in decisions}
-    for cand in candidates:
-        decision = decisions_by_id.get(cand["id"], {"decision": "KEEP", "reason": ""})
-        cand["decision"] = decision["decision"]
-        cand["reason"] = decision.get("reason", "")
-
-    keep_segments, total_duration = compute_keep_segments(
-        captions, candidates, decisions, min_keep=args.min_keep
-    )
-
-    estimated_duration = sum(end - start for start, end in keep_segments)
-
-    cut_plan = {
-        "video": args.video,
-        "transcript": args.transcript,
-        "min_gap": args.min_gap,
-        "context": args.context,
-        "total_duration_sec": round(total_duration, 3),
-        "estimated_edited_duration_sec": round(estimated_duration, 3),
-        "candidates": candidates,
-        "keep_segments": [
-            {
-                "start_sec": round(start, 3),
-                "end_sec": round(end, 3),
-                "duration_sec": round(end - start, 3),
-            }
-            for start, end in keep_segments
-        ],
-    }
-
-    cut_plan_path = os.path.join(args.outdir, "cut_plan.json")
-    keep_csv_path = os.path.join(args.outdir, "keep_segments.csv")
-    write_cut_plan(cut_plan_path, cut_plan)
-    write_keep_csv(keep_csv_path, keep_segments)
+        cache = DecisionCache(cache_path)
+    stream = None
+    render_job = None
+    if args.render and args.stream_render and args.render_mode == "reencode":
+        stream, render_job = start_stream_render(
+            args, args.video, args.outdir, cache=open_render_cache(args), trace=trace
+        )
+    try:
+        result = plan_video(
+            args,
+            args.video,
+            args.transcript,
+            args.outdir,
+            cache=cache,
+            trace=trace,
+            decision_stream=stream,
+        )
+    except BaseException as exc:
+        if stream is not None:
+            stream.fail(exc)
+        raise
+    finally:
+        if cache is not None:
+            cache_stats = cache.stats()
+            trace.set(decision_cache=cache_stats)
+            cache.close()
+    if result["audio_error"]:
+        print(f"Audio analysis skipped: {result['audio_error']}", file=sys.stderr)
+
+    planned = result["planned"]
+    audio_kept = result["audio_kept"]
+    llm_stats = result["llm_stats"]
+    keep_segments = result["keep_segments"]
+    total_duration = result["total_duration"]
+    estimated_duration = result["estimated_duration"]
 
     edited_path = os.path.join(args.outdir, "edited.mp4")
-    rendered = False
-    if args.render and keep_segments:
+    rendered = None
+    if render_job is not None:
+        try:
+            rendered = render_job.result()
+        except Exception as exc:
+            print(f"Render skipped: {exc}", file=sys.stderr)
+    elif args.render and keep_segments:
         try:
-            render_video(args.video, keep_segments, edited_path)
-            rendered = True
+            rendered = render_plan(
+                args,
+                args.video,
+                keep_segments,
+                args.outdir,
+                cache=open_render_cache(args),
+                trace=trace,
+            )
         except Exception as exc:
             print(f"Render skipped: {exc}", file=sys.stderr)
+    trace.write(os.path.join(args.outdir, "trace.json"))
 
-    num_cut = sum(1 for c in candidates if c.get("decision") == "CUT")
-    num_keep = sum(1 for c in candidates if c.get("decision") == "KEEP")
+    num_cut = sum(1 for c in planned if c.get("decision") == "CUT")
+    num_keep = sum(1 for c in planned if c.get("decision") == "KEEP")
 
-    print(f"Gaps found: {len(candidates)}")
+    print(f"Gaps found: {len(planned)}")
     print(f"Decisions: CUT={num_cut} KEEP={num_keep}")
-    print(f"Original duration (from transcript): {total_duration:.2f}s")
+    if args.audio_silence:
+        print(f"Kept by audio check (not sent to Gemini): {len(audio_kept)}")
+    print(
+        f"Gemini calls: {llm_stats['llm_calls']} "
+        f"(~{llm_stats['prompt_tokens']} prompt tokens)"
+    )
+    if llm_stats["local_decided"]:
+        print(
+            f"Decided locally: {llm_stats['local_decided']} gaps "
+            f"(~{llm_stats['llm_calls_saved']} Gemini calls saved)"
+        )
+    if llm_stats.get("journal_replayed"):
+        print(f"Resumed from journal: {llm_stats['journal_replayed']} decisions")
+    if cache_stats is not None:
+        print(
+            f"Decision cache: hits={cache_stats['hits']} misses={cache_stats['misses']}"
+        )
+    print(f"Original duration (from {result['duration_source']}): {total_duration:.2f}s")
     print(f"Estimated edited duration: {estimated_duration:.2f}s")
+    print(f"Edited subtitles: {result['subtitle_count']} captions")
     if rendered:
-        print(f"Edited video: {edited_path}")
+        print(f"Edited video: {edited_path} ({rendered})")
     else:
         print("Edited video: not rendered")
+    print(
+        "Timing: "
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in trace.stage_seconds())
+    )
 
     return 0
 
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+
+
+PROBE_VERSION = 1
+SIDECAR_SUFFIX = ".probe.json"
+HASH_CHUNK = 1024 * 1024
+MEMO_SIZE = 64
+STREAM_ENTRIES = (
+    "index,codec_type,codec_name,profile,pix_fmt,width,height,r_frame_rate,"
+    "start_time,duration,sample_rate,channels"
+)
+
+_memo = OrderedDict()
+_lock = threading.Lock()
+
+
+def content_hash(path, size=None):
+    # Size plus the first and last megabyte: cheap enough to run on every probe,
+    # and catches a file replaced in place with its mtime preserved.
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    with open(path, "rb") as handle:
+        digest.update(handle.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            handle.seek(-HASH_CHUNK, os.SEEK_END)
+            digest.update(handle.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def _run_ffprobe(args):
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, "-v", "error", *args], capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def _frame_rate(stream):
+    num, _, den = (stream.get("r_frame_rate") or "0/1").partition("/")
+    try:
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _probe_streams(path):
+    output = _run_ffprobe(
+        [
+            "-show_entries",
+            f"format=duration:stream={STREAM_ENTRIES}",
+            "-of",
+            "json",
+            path,
+        ]
+    )
+    if output is None:
+        return None
+    try:
+        data = json.loads(output or "{}")
+    except json.JSONDecodeError:
+        return None
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    duration = _to_float((data.get("format") or {}).get("duration"))
+    if duration is None:
+        durations = [_to_float(s.get("duration")) for s in streams]
+        duration = max((d for d in durations if d is not None), default=None)
+    return {
+        "duration": duration,
+        "streams": streams,
+        "video": video,
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+        "frame_rate": _frame_rate(video) if video else None,
+        "keyframes": None,
+    }
+
+
+def _scan_keyframes(path):
+    output = _run_ffprobe(
+        [
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,dts_time,flags",
+            "-of",
+            "csv=p=0",
+            path,
+        ]
+    )
+    keyframes = []
+    for line in (output or "").splitlines():
+        fields = line.split(",")
+        if len(fields) < 3 or "K" not in fields[2] or "N/A" in fields[:2]:
+            continue
+        try:
+            keyframes.append([float(fields[0]), float(fields[1])])
+        except ValueError:
+            continue
+    keyframes.sort()
+    return keyframes
+
+
+def _read_sidecar(path, key):
+    try:
+        with open(sidecar_path(path), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("key") != key:
+        return None
+    return data.get("info")
+
+
+def _write_sidecar(path, key, info):
+    target = sidecar_path(path)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump({"key": key, "info": info}, handle, separators=(",", ":"))
+        os.replace(tmp_path, target)
+    except OSError:
+        # Read-only source folders still get the in-process cache.
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _cache_key(path):
+    stat = os.stat(path)
+    return [PROBE_VERSION, stat.st_size, stat.st_mtime_ns, content_hash(path, stat.st_size)]
+
+
+def probe_media(path, keyframes=False):
+    # One ffprobe per source file: results are kept in memory and in a sidecar
+    # next to the file, keyed by size, mtime and a partial content hash.
+    # Keyframes need a full packet scan, so they are only probed on request.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    memo_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        info = _memo.get(memo_key)
+        if info is not None:
+            _memo.move_to_end(memo_key)
+    if info is not None and (not keyframes or info["keyframes"] is not None):
+        return info
+
+    key = _cache_key(path)
+    if info is None:
+        info = _read_sidecar(path, key)
+    changed = False
+    if info is None:
+        info = _probe_streams(path)
+        if info is None:
+            return None
+        changed = True
+    if keyframes and info["keyframes"] is None:
+        info = dict(info, keyframes=_scan_keyframes(path))
+        changed = True
+    if changed:
+        _write_sidecar(path, key, info)
+    with _lock:
+        _memo[memo_key] = info
+        _memo.move_to_end(memo_key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return info
+
+
+def probe_duration(path):
+    info = probe_media(path)
+    return info["duration"] if info else None
+
+
+def probe_video_stream(path):
+    info = probe_media(path)
+    return info["video"] if info else None
+
+
+def probe_has_audio(path):
+    info = probe_media(path)
+    return bool(info and info["has_audio"])
+
+
+def probe_keyframes(path):
+    info = probe_media(path, keyframes=True)
+    return [tuple(item) for item in info["keyframes"]] if info else []
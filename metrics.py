@@ -0,0 +1,150 @@
+import json
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _percentile(values, fraction, digits=4):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index], digits)
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self.batches = []
+        self.ffmpeg = []
+        self.info = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        # CPU time is process-wide, so concurrent jobs in one process share it.
+        cpu = time.process_time()
+        child_cpu = _children_cpu()
+        try:
+            yield
+        finally:
+            record = {
+                "name": name,
+                "wall_sec": round(time.perf_counter() - wall, 4),
+                "cpu_sec": round(time.process_time() - cpu, 4),
+                "child_cpu_sec": round(_children_cpu() - child_cpu, 4),
+            }
+            with self._lock:
+                self.stages.append(record)
+
+    def record_batch(self, **values):
+        with self._lock:
+            self.batches.append(values)
+
+    def record_ffmpeg(self, **values):
+        with self._lock:
+            self.ffmpeg.append(values)
+
+    def set(self, **values):
+        with self._lock:
+            self.info.update(values)
+
+    def stage_seconds(self):
+        with self._lock:
+            return [(item["name"], item["wall_sec"]) for item in self.stages]
+
+    def to_dict(self):
+        with self._lock:
+            batches = list(self.batches)
+            latencies = [
+                latency for batch in batches for latency in batch.get("latencies_sec", [])
+            ]
+            return {
+                "started": self.started,
+                "info": dict(self.info),
+                "stages": list(self.stages),
+                "llm": {
+                    "batches": len(batches),
+                    "calls": sum(batch.get("attempts", 0) for batch in batches),
+                    "retries": sum(max(0, batch.get("attempts", 0) - 1) for batch in batches),
+                    "errors": sum(batch.get("errors", 0) for batch in batches),
+                    "prompt_tokens": sum(batch.get("prompt_tokens", 0) for batch in batches),
+                    "output_tokens": sum(batch.get("output_tokens", 0) for batch in batches),
+                    "latency_p50_sec": _percentile(latencies, 0.5),
+                    "latency_p95_sec": _percentile(latencies, 0.95),
+                    "per_batch": batches,
+                },
+                "ffmpeg": list(self.ffmpeg),
+            }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(self.to_dict(), handle, indent=2)
+
+
+class MetricsRegistry:
+    def __init__(self, recent=50):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        self.jobs = {"done": 0, "error": 0}
+        self.stages = {}
+        self.llm = {"calls": 0, "retries": 0, "errors": 0, "prompt_tokens": 0, "output_tokens": 0}
+        self.ffmpeg = {"runs": 0, "wall_sec": 0.0, "frames": 0, "media_sec": 0.0}
+
+    def add(self, job_id, status, trace):
+        data = trace.to_dict()
+        with self._lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            for item in data["stages"]:
+                totals = self.stages.setdefault(
+                    item["name"], {"count": 0, "wall_sec": 0.0, "cpu_sec": 0.0}
+                )
+                totals["count"] += 1
+                totals["wall_sec"] += item["wall_sec"]
+                totals["cpu_sec"] += item["cpu_sec"] + item["child_cpu_sec"]
+            for key in self.llm:
+                self.llm[key] += data["llm"][key]
+            for run in data["ffmpeg"]:
+                self.ffmpeg["runs"] += 1
+                self.ffmpeg["wall_sec"] += run.get("wall_sec", 0.0)
+                self.ffmpeg["frames"] += run.get("frames") or 0
+                self.ffmpeg["media_sec"] += run.get("out_time_sec") or 0.0
+            self._recent.append(
+                {
+                    "job_id": job_id,
+                    "status": status,
+                    "stages": {item["name"]: item["wall_sec"] for item in data["stages"]},
+                    "llm_calls": data["llm"]["calls"],
+                }
+            )
+
+    def snapshot(self):
+        with self._lock:
+            ffmpeg = dict(self.ffmpeg)
+            wall = ffmpeg["wall_sec"]
+            ffmpeg["avg_fps"] = round(ffmpeg["frames"] / wall, 1) if wall else None
+            ffmpeg["avg_speed"] = round(ffmpeg["media_sec"] / wall, 2) if wall else None
+            return {
+                "jobs": dict(self.jobs),
+                "stages": {
+                    name: {
+                        "count": totals["count"],
+                        "wall_sec": round(totals["wall_sec"], 3),
+                        "cpu_sec": round(totals["cpu_sec"], 3),
+                        "avg_wall_sec": round(totals["wall_sec"] / totals["count"], 3),
+                    }
+                    for name, totals in self.stages.items()
+                },
+                "llm": dict(self.llm),
+                "ffmpeg": ffmpeg,
+                "recent_jobs": list(self._recent),
+            }
@@ -0,0 +1,419 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_analysis import detect_silences, refine_candidates
+from caption_table import CaptionTable
+from cutter import compute_keep_segments
+from decider import count_batches, decide_gaps
+from decision_journal import DecisionJournal, journal_fingerprint
+from ffmpeg_render import RENDER_MODES, render_segment_stream, render_video
+from gap_detector import detect_gaps
+from gemini_client import GeminiClient
+from local_decider import (
+    DEFAULT_THRESHOLD,
+    LocalScorer,
+    apply_decisions,
+    check_threshold,
+    load_model,
+)
+from media_probe import probe_duration
+from metrics import Trace
+from plan_io import save_cut_plan
+from plan_stream import DecisionStream
+from render_cache import RenderCache
+from subtitles import write_edited_subtitles
+from transcript_parser import iter_captions
+
+
+JOURNAL_FILE = "decisions.journal.jsonl"
+
+
+def write_keep_csv(path, segments):
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["start_sec", "end_sec", "duration_sec"])
+        for start, end in segments:
+            writer.writerow([f"{start:.3f}", f"{end:.3f}", f"{(end - start):.3f}"])
+
+
+def _requests_per_minute(value):
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = 0.0
+    if rate <= 0:
+        raise argparse.ArgumentTypeError("must be a positive number of requests per minute.")
+    return rate
+
+
+def _local_threshold(value):
+    try:
+        return check_threshold(float(value))
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def add_pipeline_args(parser):
+    parser.add_argument("--min-gap", type=float, default=0.8, help="Min gap to consider")
+    parser.add_argument("--context", type=int, default=2, help="Captions before/after")
+    parser.add_argument("--batch-size", type=int, default=10, help="Gemini batch size")
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=None,
+        help="Pack Gemini batches up to this many prompt tokens instead of --batch-size",
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=1,
+        help="Gemini batches kept in flight at once",
+    )
+    parser.add_argument(
+        "--llm-rpm",
+        type=_requests_per_minute,
+        default=None,
+        help="Max Gemini requests per minute (default: unlimited)",
+    )
+    parser.add_argument(
+        "--decision-cache",
+        default=None,
+        help="SQLite decision cache (default: <outdir>/.cache/decisions.sqlite)",
+    )
+    parser.add_argument(
+        "--no-decision-cache",
+        dest="use_decision_cache",
+        action="store_false",
+        help="Always ask Gemini, ignoring cached decisions",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse Gemini decisions journaled by an interrupted run in the same outdir",
+    )
+    parser.add_argument(
+        "--local-threshold",
+        type=_local_threshold,
+        default=DEFAULT_THRESHOLD,
+        help="Confidence needed to decide a gap locally instead of asking Gemini",
+    )
+    parser.add_argument(
+        "--local-model",
+        default=None,
+        help="JSON file with logistic weights for the local gap scorer",
+    )
+    parser.add_argument(
+        "--no-local-decider",
+        dest="use_local_decider",
+        action="store_false",
+        help="Send every gap to Gemini",
+    )
+    parser.add_argument(
+        "--audio-silence",
+        action="store_true",
+        help="Check gaps against audio energy before asking Gemini",
+    )
+    parser.add_argument(
+        "--silence-db",
+        type=float,
+        default=-40.0,
+        help="RMS level (dBFS) below which audio counts as silent",
+    )
+    parser.add_argument(
+        "--min-silence",
+        type=float,
+        default=0.3,
+        help="Shortest audio silence to use when refining gaps",
+    )
+    parser.add_argument(
+        "--min-keep", type=float, default=0.25, help="Minimum keep segment length"
+    )
+    parser.add_argument(
+        "--merge-gap",
+        type=float,
+        default=0.1,
+        help="Merge keep segments separated by at most this many seconds",
+    )
+    parser.add_argument(
+        "--compress-plan",
+        action="store_true",
+        help="Write the cut plan gzip-compressed as cut_plan.jsonl.gz",
+    )
+    parser.add_argument(
+        "--render",
+        dest="render",
+        action="store_true",
+        help="Render edited video with ffmpeg (default)",
+    )
+    parser.add_argument(
+        "--no-render",
+        dest="render",
+        action="store_false",
+        help="Skip video rendering",
+    )
+    parser.add_argument(
+        "--render-mode",
+        choices=RENDER_MODES,
+        default="reencode",
+        help="reencode: exact full re-encode; smart: stream-copy between keyframes "
+        "and re-encode only around cuts; copy: keyframe-aligned stream copy",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="Parallel ffmpeg processes for rendering (threads are split between them)",
+    )
+    parser.add_argument(
+        "--stream-render",
+        action="store_true",
+        help="Start encoding the settled part of the timeline while Gemini is still "
+        "deciding later gaps (reencode mode)",
+    )
+    add_render_cache_args(parser)
+    parser.set_defaults(render=True)
+
+
+def default_pipeline_args(**overrides):
+    parser = argparse.ArgumentParser(add_help=False)
+    add_pipeline_args(parser)
+    args = parser.parse_args([])
+    vars(args).update(overrides)
+    return args
+
+
+def _ignore_progress(stage, fraction=0.0):
+    pass
+
+
+def add_render_cache_args(parser):
+    parser.add_argument(
+        "--render-cache",
+        default=None,
+        help="Directory for cached re-encoded pieces; re-renders only encode changed pieces",
+    )
+    parser.add_argument(
+        "--render-cache-mb",
+        type=int,
+        default=10240,
+        help="Size budget for --render-cache, oldest pieces are evicted first",
+    )
+
+
+def open_local_scorer(args):
+    if not args.use_local_decider:
+        return None
+    model = load_model(args.local_model) if args.local_model else None
+    return LocalScorer(threshold=args.local_threshold, model=model)
+
+
+def open_render_cache(args):
+    if not args.render_cache:
+        return None
+    return RenderCache(args.render_cache, max_bytes=args.render_cache_mb * 1024 * 1024)
+
+
+def plan_video(
+    args,
+    video_path,
+    transcript_path,
+    outdir,
+    client=None,
+    rate_limiter=None,
+    cache=None,
+    trace=None,
+    decision_stream=None,
+    progress=None,
+):
+    trace = trace or Trace()
+    progress = progress or _ignore_progress
+    os.makedirs(outdir, exist_ok=True)
+
+    progress("parsing")
+    with trace.stage("parse"):
+        captions = CaptionTable.from_captions(iter_captions(transcript_path))
+    with trace.stage("detect_gaps"):
+        candidates = detect_gaps(captions, min_gap=args.min_gap, context=args.context)
+    trace.set(captions=len(captions), candidates=len(candidates))
+    with trace.stage("probe"):
+        video_duration = probe_duration(video_path)
+    total_duration = video_duration or captions.duration()
+
+    audio_kept = []
+    audio_error = None
+    if args.audio_silence and candidates:
+        progress("audio")
+        try:
+            with trace.stage("audio"):
+                silences = detect_silences(
+                    video_path,
+                    threshold_db=args.silence_db,
+                    min_silence=args.min_silence,
+                )
+        except RuntimeError as exc:
+            audio_error = str(exc)
+        else:
+            candidates, audio_kept = refine_candidates(candidates, silences)
+
+    decisions = []
+    llm_stats = {
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "journal_replayed": 0,
+        "local_decided": 0,
+        "llm_calls_saved": 0,
+    }
+    ambiguous = candidates
+    scorer = open_local_scorer(args)
+    if scorer is not None and candidates:
+        with trace.stage("local_decide"):
+            decisions, ambiguous = scorer.split(candidates)
+        llm_stats["local_decided"] = len(decisions)
+        llm_stats["llm_calls_saved"] = count_batches(
+            candidates, args.batch_size, args.token_budget
+        ) - count_batches(ambiguous, args.batch_size, args.token_budget)
+    if decision_stream is not None:
+        decision_stream.start(
+            candidates, total_duration, args.merge_gap, args.min_keep
+        )
+        decision_stream.add(decisions)
+
+    if ambiguous:
+        progress("deciding")
+        client = client or GeminiClient()
+        journal = DecisionJournal(
+            os.path.join(outdir, JOURNAL_FILE),
+            journal_fingerprint(getattr(client, "model", ""), ambiguous),
+            resume=getattr(args, "resume", False),
+        )
+        try:
+            with trace.stage("decide"):
+                decisions += decide_gaps(
+                    ambiguous,
+                    client,
+                    batch_size=args.batch_size,
+                    max_retries=2,
+                    concurrency=args.llm_concurrency,
+                    requests_per_minute=args.llm_rpm,
+                    rate_limiter=rate_limiter,
+                    cache=cache,
+                    token_budget=args.token_budget,
+                    stats=llm_stats,
+                    trace=trace,
+                    journal=journal,
+                    progress=lambda done, total: progress("deciding", done / total),
+                    on_decisions=decision_stream.add if decision_stream else None,
+                )
+        finally:
+            journal.close()
+    if decision_stream is not None:
+        decision_stream.finish()
+
+    apply_decisions(candidates, decisions, audio_kept)
+    planned = sorted(candidates + audio_kept, key=lambda item: item["gap_start"])
+
+    progress("planning")
+    with trace.stage("plan"):
+        keep_segments, total_duration = compute_keep_segments(
+            captions,
+            candidates,
+            decisions,
+            merge_gap=args.merge_gap,
+            min_keep=args.min_keep,
+            total_duration=total_duration,
+        )
+
+    estimated_duration = sum(end - start for start, end in keep_segments)
+
+    cut_plan = {
+        "video": video_path,
+        "transcript": transcript_path,
+        "min_gap": args.min_gap,
+        "context": args.context,
+        "audio_silence": (
+            {"threshold_db": args.silence_db, "min_silence": args.min_silence}
+            if args.audio_silence
+            else None
+        ),
+        "merge_gap": args.merge_gap,
+        "min_keep": args.min_keep,
+        "total_duration_sec": round(total_duration, 3),
+        "duration_source": "video" if video_duration else "transcript",
+        "estimated_edited_duration_sec": round(estimated_duration, 3),
+        "llm_usage": {
+            "calls": llm_stats["llm_calls"],
+            "prompt_tokens_estimated": llm_stats["prompt_tokens"],
+            "local_decided": llm_stats["local_decided"],
+            "calls_saved_estimated": llm_stats["llm_calls_saved"],
+        },
+        "candidates": planned,
+        "keep_segments": [
+            {
+                "start_sec": round(start, 3),
+                "end_sec": round(end, 3),
+                "duration_sec": round(end - start, 3),
+            }
+            for start, end in keep_segments
+        ],
+    }
+
+    save_cut_plan(outdir, cut_plan, compress=args.compress_plan)
+    write_keep_csv(os.path.join(outdir, "keep_segments.csv"), keep_segments)
+    with trace.stage("subtitles"):
+        subtitle_count = write_edited_subtitles(outdir, captions, keep_segments)
+
+    return {
+        "planned": planned,
+        "audio_kept": audio_kept,
+        "audio_error": audio_error,
+        "keep_segments": keep_segments,
+        "total_duration": total_duration,
+        "duration_source": "video" if video_duration else "transcript",
+        "estimated_duration": estimated_duration,
+        "llm_stats": llm_stats,
+        "subtitle_count": subtitle_count,
+    }
+
+
+def render_plan(
+    args, video_path, keep_segments, outdir, cache=None, trace=None, progress=None
+):
+    trace = trace or Trace()
+    progress = progress or _ignore_progress
+    edited_path = os.path.join(outdir, "edited.mp4")
+    progress("rendering")
+    with trace.stage("render"):
+        return render_video(
+            video_path,
+            keep_segments,
+            edited_path,
+            mode=args.render_mode,
+            workers=args.render_workers,
+            progress=lambda fraction: progress("rendering", fraction),
+            cache=cache,
+            trace=trace,
+        )
+
+
+def start_stream_render(args, video_path, outdir, cache=None, trace=None):
+    trace = trace or Trace()
+    stream = DecisionStream()
+    edited_path = os.path.join(outdir, "edited.mp4")
+
+    def render():
+        with trace.stage("render"):
+            return render_segment_stream(
+                video_path,
+                stream.segments(),
+                edited_path,
+                workers=args.render_workers,
+                cache=cache,
+                trace=trace,
+            )
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+    job = pool.submit(render)
+    pool.shutdown(wait=False)
+    return stream, job
@@ -0,0 +1,201 @@
+import gzip
+import json
+import os
+
+
+PLAN_FORMAT = "cut_plan"
+PLAN_VERSION = 2
+PLAN_FILE = "cut_plan.jsonl"
+PLAN_FILE_GZIP = "cut_plan.jsonl.gz"
+# Version 1 plans were a single JSON document under this name.
+LEGACY_PLAN_FILE = "cut_plan.json"
+PLAN_FILES = (PLAN_FILE, PLAN_FILE_GZIP, LEGACY_PLAN_FILE)
+GZIP_MAGIC = b"\x1f\x8b"
+BODY_KEYS = ("candidates", "keep_segments")
+
+
+def _open_text(path, mode, compressed=None):
+    if compressed is None:
+        with open(path, "rb") as handle:
+            compressed = handle.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=list)
+
+
+class PlanWriter:
+    # One JSON value per line: a header, the keep segments, then captions and
+    # candidates. Each caption is written once, just before the first candidate
+    # that refers to it, and candidates point at captions by index.
+    def __init__(self, path, header, compress=None):
+        if compress is None:
+            compress = path.endswith(".gz")
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._handle = _open_text(self._tmp_path, "w", compressed=compress)
+        self._captions = {}
+        header = {key: value for key, value in header.items() if key not in BODY_KEYS}
+        self._write({"format": PLAN_FORMAT, "version": PLAN_VERSION, **header})
+
+    def _write(self, value):
+        self._handle.write(_dump(value))
+        self._handle.write("\n")
+
+    def keep_segment(self, start, end):
+        self._write(["k", start, end])
+
+    def _caption_refs(self, items):
+        refs = []
+        for item in items:
+            key = (item["start_sec"], item["end_sec"], item["text"])
+            index = self._captions.get(key)
+            if index is None:
+                index = self._captions[key] = len(self._captions)
+                self._write(["c", *key])
+            refs.append(index)
+        if len(refs) > 1 and refs == list(range(refs[0], refs[-1] + 1)):
+            return {"from": refs[0], "to": refs[-1] + 1}
+        return refs
+
+    def candidate(self, cand):
+        record = dict(cand)
+        record["context_before"] = self._caption_refs(cand.get("context_before", ()))
+        record["context_after"] = self._caption_refs(cand.get("context_after", ()))
+        self._write(["g", record])
+
+    def close(self):
+        self._handle.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._handle.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_cut_plan(path, data, compress=None):
+    with PlanWriter(path, data, compress=compress) as writer:
+        for item in data.get("keep_segments", ()):
+            writer.keep_segment(item["start_sec"], item["end_sec"])
+        for cand in data.get("candidates", ()):
+            writer.candidate(cand)
+
+
+def save_cut_plan(directory, data, compress=False):
+    # Older or differently compressed plans in the same folder would go stale.
+    name = PLAN_FILE_GZIP if compress else PLAN_FILE
+    path = os.path.join(directory, name)
+    write_cut_plan(path, data, compress=compress)
+    for other in PLAN_FILES:
+        if other != name:
+            try:
+                os.remove(os.path.join(directory, other))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def find_cut_plan(directory):
+    for name in PLAN_FILES:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class PlanReader:
+    def __init__(self, path):
+        self.path = path
+        with _open_text(path, "r") as handle:
+            first = handle.readline()
+        try:
+            header = json.loads(first)
+        except ValueError:
+            header = None
+        self._document = None
+        if isinstance(header, dict) and header.get("format") == PLAN_FORMAT:
+            if header.get("version", 0) > PLAN_VERSION:
+                raise ValueError(
+                    f"{path} uses plan format {header['version']}, "
+                    f"newer than the supported {PLAN_VERSION}."
+                )
+            self.version = header["version"]
+            self.header = {
+                key: value
+                for key, value in header.items()
+                if key not in ("format", "version")
+            }
+        else:
+            # Version 1 plans are a single indented JSON document.
+            with _open_text(path, "r") as handle:
+                self._document = json.load(handle)
+            self.version = 1
+            self.header = {
+                key: value for key, value in self._document.items() if key not in BODY_KEYS
+            }
+
+    def _records(self, tags):
+        with _open_text(self.path, "r") as handle:
+            handle.readline()
+            for line in handle:
+                # Records start with ["<tag>", so other kinds are skipped unparsed.
+                if line[2:3] in tags:
+                    yield json.loads(line)
+
+    def iter_keep_segments(self):
+        if self._document is not None:
+            for item in self._document.get("keep_segments", []):
+                yield [item["start_sec"], item["end_sec"]]
+            return
+        for _, start, end in self._records("k"):
+            yield [start, end]
+
+    def iter_candidates(self, with_context=True):
+        if self._document is not None:
+            yield from self._document.get("candidates", [])
+            return
+        captions = []
+        for record in self._records("cg" if with_context else "g"):
+            if record[0] == "c":
+                captions.append(
+                    {"start_sec": record[1], "end_sec": record[2], "text": record[3]}
+                )
+                continue
+            cand = record[1]
+            for key in ("context_before", "context_after"):
+                refs = cand.pop(key, [])
+                if not with_context:
+                    continue
+                if isinstance(refs, dict):
+                    refs = range(refs["from"], refs["to"])
+                cand[key] = [captions[index] for index in refs]
+            yield cand
+
+    def load(self):
+        plan = dict(self.header)
+        plan["candidates"] = list(self.iter_candidates())
+        plan["keep_segments"] = [
+            {
+                "start_sec": start,
+                "end_sec": end,
+                "duration_sec": round(end - start, 3),
+            }
+            for start, end in self.iter_keep_segments()
+        ]
+        return plan
+
+
+def load_cut_plan(path):
+    return PlanReader(path).load()
@@ -0,0 +1,56 @@
+import threading
+
+from cutter import iter_keep_segments
+
+
+class DecisionStream:
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._plan = None
+        self._decisions = {}
+        self._finished = False
+        self._error = None
+
+    def start(self, candidates, total_duration, merge_gap, min_keep):
+        with self._changed:
+            self._plan = (list(candidates), total_duration, merge_gap, min_keep)
+            self._changed.notify_all()
+
+    def add(self, items):
+        with self._changed:
+            self._decisions.update((item["id"], item) for item in items)
+            self._changed.notify_all()
+
+    def finish(self):
+        with self._changed:
+            self._finished = True
+            self._changed.notify_all()
+
+    def fail(self, error):
+        with self._changed:
+            self._error = error
+            self._changed.notify_all()
+
+    def _wait(self, ready):
+        with self._changed:
+            self._changed.wait_for(lambda: self._error is not None or ready())
+            if self._error is not None:
+                raise RuntimeError(f"Planning stopped: {self._error}")
+
+    def _decided_candidates(self, candidates):
+        # Candidates are in time order, so everything before the first
+        # undecided gap is final even while later batches are in flight.
+        for cand in candidates:
+            self._wait(lambda: self._finished or cand["id"] in self._decisions)
+            yield cand
+
+    def segments(self):
+        self._wait(lambda: self._plan is not None)
+        candidates, total_duration, merge_gap, min_keep = self._plan
+        return iter_keep_segments(
+            self._decided_candidates(candidates),
+            self._decisions,
+            merge_gap,
+            min_keep,
+            total_duration,
+        )
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+
+CACHE_VERSION = 2
+PIECE_EXTENSION = ".mkv"
+
+
+def source_id(path):
+    # Blob-store hard links share an inode, so re-uploads of the same file share pieces.
+    stat = os.stat(path)
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def piece_key(source, segments, settings):
+    payload = [
+        CACHE_VERSION,
+        source,
+        [[round(start, 3), round(end, 3)] for start, end in segments],
+        settings,
+    ]
+    data = json.dumps(payload, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _place(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class RenderCache:
+    def __init__(self, root, max_bytes=10 * 1024**3):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key + PIECE_EXTENSION)
+
+    def fetch(self, key, dest_path):
+        path = self.path_for(key)
+        try:
+            _place(path, dest_path)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, piece_path):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        _place(piece_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def evict(self, keep=()):
+        keep = {self.path_for(key) for key in keep}
+        entries = []
+        total = 0
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if not entry.name.endswith(PIECE_EXTENSION):
+                    continue
+                stat = entry.stat()
+                total += stat.st_size
+                if entry.path not in keep:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
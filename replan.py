@@ -0,0 +1,79 @@
+from cutter import compute_keep_segments
+
+
+DECISIONS = ("CUT", "KEEP")
+DEFAULT_MERGE_GAP = 0.1
+DEFAULT_MIN_KEEP = 0.25
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values or ():
+        gap_id, sep, decision = value.partition("=")
+        if not sep or not gap_id.strip():
+            raise ValueError(f"Override must look like GAP_ID=CUT or GAP_ID=KEEP: {value}")
+        overrides[gap_id.strip()] = decision.strip()
+    return overrides
+
+
+def apply_overrides(candidates, overrides):
+    by_id = {cand["id"]: cand for cand in candidates}
+    for gap_id, decision in overrides.items():
+        decision = str(decision).upper()
+        if decision not in DECISIONS:
+            raise ValueError(f"Override for {gap_id} must be CUT or KEEP, got {decision!r}.")
+        cand = by_id.get(gap_id)
+        if cand is None:
+            raise ValueError(f"Unknown gap id in overrides: {gap_id}")
+        if cand.get("decision") == decision:
+            continue
+        if cand.get("original_decision") == decision:
+            cand["decision"] = cand.pop("original_decision")
+            cand["reason"] = cand.pop("original_reason", "")
+            source = cand.pop("original_decision_source", None)
+            if source:
+                cand["decision_source"] = source
+            else:
+                cand.pop("decision_source", None)
+            continue
+        if "original_decision" not in cand:
+            cand["original_decision"] = cand.get("decision", "KEEP")
+            cand["original_reason"] = cand.get("reason", "")
+            if "decision_source" in cand:
+                cand["original_decision_source"] = cand["decision_source"]
+        cand["decision"] = decision
+        cand["reason"] = "manual override"
+        cand["decision_source"] = "manual"
+
+
+def replan_cut_plan(plan, overrides=None, merge_gap=None, min_keep=None):
+    if merge_gap is None:
+        merge_gap = plan.get("merge_gap", DEFAULT_MERGE_GAP)
+    if min_keep is None:
+        min_keep = plan.get("min_keep", DEFAULT_MIN_KEEP)
+
+    candidates = plan.get("candidates", [])
+    apply_overrides(candidates, overrides or {})
+
+    keep_segments, total_duration = compute_keep_segments(
+        None,
+        candidates,
+        candidates,
+        merge_gap=merge_gap,
+        min_keep=min_keep,
+        total_duration=plan["total_duration_sec"],
+    )
+    estimated_duration = sum(end - start for start, end in keep_segments)
+
+    plan["merge_gap"] = merge_gap
+    plan["min_keep"] = min_keep
+    plan["estimated_edited_duration_sec"] = round(estimated_duration, 3)
+    plan["keep_segments"] = [
+        {
+            "start_sec": round(start, 3),
+            "end_sec": round(end, 3),
+            "duration_sec": round(end - start, 3),
+        }
+        for start, end in keep_segments
+    ]
+    return plan, keep_segments
@@ -0,0 +1,175 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+
+
+ACCESS_FILE = ".last_access"
+RECENT_GRACE_SEC = 60.0
+
+
+def _dir_files(path):
+    # Uploads are hard links (or symlinks) into the blob store, so files are
+    # keyed by inode: a blob shared by several jobs is counted once.
+    files = {}
+    links = set()
+    for directory, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(directory, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            if os.path.islink(file_path):
+                links.add(os.path.realpath(file_path))
+            files[(stat.st_dev, stat.st_ino)] = stat.st_size
+    return files, links
+
+
+def _file_refs(jobs):
+    refs = Counter()
+    sizes = {}
+    for job in jobs:
+        refs.update(job["files"].keys())
+        sizes.update(job["files"])
+    return refs, sum(sizes.values())
+
+
+class RetentionManager:
+    def __init__(
+        self,
+        root,
+        max_bytes=None,
+        max_age_sec=None,
+        is_active=None,
+        blobs=None,
+        interval_sec=300.0,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes or None
+        self.max_age_sec = max_age_sec or None
+        self.is_active = is_active or (lambda job_id: False)
+        self.blobs = blobs
+        self.interval_sec = interval_sec
+        self.last_sweep = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, job_id):
+        path = os.path.join(self.root, job_id, ACCESS_FILE)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            if os.path.isdir(os.path.dirname(path)):
+                open(path, "a").close()
+
+    def _accessed(self, path):
+        try:
+            return os.stat(os.path.join(path, ACCESS_FILE)).st_mtime
+        except FileNotFoundError:
+            return os.stat(path).st_mtime
+
+    def scan(self):
+        jobs = []
+        in_use = set()
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return jobs, in_use
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                accessed = self._accessed(entry.path)
+            except FileNotFoundError:
+                continue
+            files, links = _dir_files(entry.path)
+            in_use.update(links)
+            jobs.append(
+                {
+                    "id": entry.name,
+                    "path": entry.path,
+                    "files": files,
+                    "bytes": sum(files.values()),
+                    "accessed": accessed,
+                }
+            )
+        jobs.sort(key=lambda job: job["accessed"])
+        return jobs, in_use
+
+    def sweep(self):
+        with self._lock:
+            started = time.time()
+            jobs, in_use = self.scan()
+            refs, total = _file_refs(jobs)
+            evicted = []
+            freed = 0
+            # Least recently accessed first; quota and age both evict.
+            for job in jobs:
+                idle = started - job["accessed"]
+                expired = self.max_age_sec is not None and idle > self.max_age_sec
+                over_quota = self.max_bytes is not None and total > self.max_bytes
+                if not (expired or over_quota):
+                    continue
+                if idle < RECENT_GRACE_SEC or self.is_active(job["id"]):
+                    continue
+                shutil.rmtree(job["path"], ignore_errors=True)
+                for key, size in job["files"].items():
+                    refs[key] -= 1
+                    if not refs[key]:
+                        total -= size
+                        freed += size
+                evicted.append(job["id"])
+            blobs_removed = 0
+            if self.blobs is not None:
+                blobs_removed = self.blobs.collect_garbage(in_use=in_use)
+            self.last_sweep = {
+                "finished": time.time(),
+                "duration_sec": round(time.time() - started, 3),
+                "evicted_jobs": len(evicted),
+                "freed_bytes": freed,
+                "blobs_removed": blobs_removed,
+                "jobs": len(jobs) - len(evicted),
+                "bytes": total,
+            }
+            return evicted
+
+    def stats(self):
+        jobs, _ = self.scan()
+        now = time.time()
+        with self._lock:
+            last_sweep = dict(self.last_sweep) if self.last_sweep else None
+        return {
+            "root": self.root,
+            "jobs": len(jobs),
+            "active_jobs": sum(1 for job in jobs if self.is_active(job["id"])),
+            "bytes": _file_refs(jobs)[1],
+            "max_bytes": self.max_bytes,
+            "max_age_sec": self.max_age_sec,
+            "oldest_idle_sec": round(now - jobs[0]["accessed"], 1) if jobs else None,
+            "blobs": self.blobs.usage() if self.blobs is not None else None,
+            "last_sweep": last_sweep,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            try:
+                self.sweep()
+            except Exception as exc:
+                print(f"Retention sweep failed: {exc}", file=sys.stderr)
+
+    def start(self):
+        if self._thread is None and self.interval_sec:
+            self._thread = threading.Thread(
+                target=self._run, name="retention", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,48 @@
+import os
+
+from cutter import TimeIndex
+
+
+def format_timestamp(seconds, sep=","):
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{sep}{millis:03d}"
+
+
+def retime_captions(captions, index, min_duration=0.05):
+    for item in captions:
+        start = index.to_edited(item["start_sec"])
+        end = index.to_edited(item["end_sec"])
+        # Captions that fall entirely inside a cut collapse to nothing.
+        if end - start >= min_duration:
+            yield {"start_sec": start, "end_sec": end, "text": item["text"]}
+
+
+def write_subtitles(srt_path, vtt_path, captions):
+    count = 0
+    with open(srt_path, "w", encoding="utf-8") as srt, open(
+        vtt_path, "w", encoding="utf-8"
+    ) as vtt:
+        vtt.write("WEBVTT\n\n")
+        for item in captions:
+            count += 1
+            start, end = item["start_sec"], item["end_sec"]
+            srt.write(
+                f"{count}\n{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                f"{item['text']}\n\n"
+            )
+            vtt.write(
+                f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n"
+                f"{item['text']}\n\n"
+            )
+    return count
+
+
+def write_edited_subtitles(outdir, captions, keep_segments):
+    return write_subtitles(
+        os.path.join(outdir, "edited.srt"),
+        os.path.join(outdir, "edited.vtt"),
+        retime_captions(captions, TimeIndex(keep_segments)),
+    )
@@ -24,6 +24,10 @@ def parse_time_token(token):
     return float(token)
 
 
+SNIFF_BYTES = 64 * 1024
+READ_BUFFER_BYTES = 64 * 1024
+
+
 def detect_format(lines):
     for line in lines:
         if line.strip().upper() == "WEBVTT":
@@ -34,36 +38,30 @@ def detect_format(lines):
     return "plain"
 
 
-def parse_srt_vtt(lines):
-    entries = []
-    i = 0
-    total = len(lines)
-    while i < total:
-        line = lines[i].strip()
+def iter_srt_vtt(lines):
+    start = end = None
+    text_lines = None
+    for raw in lines:
+        line = raw.strip()
+        if text_lines is not None:
+            if line:
+                text_lines.append(line)
+                continue
+            yield {"start_sec": start, "end_sec": end, "text": " ".join(text_lines)}
+            text_lines = None
+            continue
         if not line:
-            i += 1
             continue
-        if line.isdigit() and i + 1 < total and "-->" in lines[i + 1]:
-            i += 1
-            line = lines[i].strip()
         match = TIME_LINE_RE.match(line)
         if match:
             start = parse_timestamp(match.group("start"))
             end = parse_timestamp(match.group("end"))
-            i += 1
             text_lines = []
-            while i < total and lines[i].strip():
-                text_lines.append(lines[i].strip())
-                i += 1
-            text = " ".join(text_lines).strip()
-            entries.append({"start_sec": start, "end_sec": end, "text": text})
-        else:
-            i += 1
-    return entries
+    if text_lines is not None:
+        yield {"start_sec": start, "end_sec": end, "text": " ".join(text_lines)}
 
 
-def parse_plain(lines):
-    entries = []
+def iter_plain(lines):
     for line in lines:
         stripped = line.strip()
         if not stripped:
@@ -77,21 +75,44 @@ def parse_plain(lines):
         except ValueError:
             continue
         text = " ".join(parts[2:]).strip()
-        entries.append({"start_sec": start, "end_sec": end, "text": text})
-    return entries
+        yield {"start_sec": start, "end_sec": end, "text": text}
 
 
-def parse_transcript(path):
+def parse_srt_vtt(lines):
+    return list(iter_srt_vtt(lines))
+
+
+def parse_plain(lines):
+    return list(iter_plain(lines))
+
+
+def sniff_format(path):
     with open(path, "r", encoding="utf-8") as handle:
-        content = handle.read()
+        prefix = handle.read(SNIFF_BYTES)
+    return detect_format(prefix.splitlines())
+
+
+def _iter_file(path, fmt):
+    with open(path, "r", encoding="utf-8", buffering=READ_BUFFER_BYTES) as handle:
+        if fmt in ("vtt", "srt_vtt"):
+            yield from iter_srt_vtt(handle)
+        else:
+            yield from iter_plain(handle)
+
+
+def _sort_key(item):
+    return (item["start_sec"], item["end_sec"])
 
-    lines = content.splitlines()
-    fmt = detect_format(lines)
 
-    if fmt in ("vtt", "srt_vtt"):
-        entries = parse_srt_vtt(lines)
-    else:
-        entries = parse_plain(lines)
+def iter_captions(path):
+    # Streams captions in file order with a single parse. Consumers that need
+    # time order sort afterwards (CaptionTable.from_captions does so only when
+    # it sees an out-of-order caption).
+    yield from _iter_file(path, sniff_format(path))
 
-    entries.sort(key=lambda item: (item["start_sec"], item["end_sec"]))
-    return entries
+
+def parse_transcript(path):
+    captions = list(iter_captions(path))
+    if any(_sort_key(a) > _sort_key(b) for a, b in zip(captions, captions[1:])):
+        captions.sort(key=_sort_key)
+    return captions
@@ -1,16 +1,49 @@
-import csv
+import hmac
 import json
 import os
+import sys
+import threading
 import uuid
-
-from flask import Flask, render_template, request, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import (
+    Flask,
+    Request,
+    Response,
+    jsonify,
+    render_template,
+    request,
+    send_from_directory,
+    stream_with_context,
+    url_for,
+)
 from werkzeug.utils import secure_filename
 
-from cutter import compute_keep_segments
-from decider import decide_gaps
-from ffmpeg_render import render_video
-from gap_detector import detect_gaps
-from gemini_client import GeminiClient
+from blob_store import BlobStore
+from decision_cache import DecisionCache
+from ffmpeg_render import (
+    PREVIEW_PLAYLIST,
+    RENDER_MODES,
+    make_proxy,
+    proxy_path,
+    render_preview,
+)
+from job_queue import FINISHED_STATUSES, JobQueue, QueueFullError
+from local_decider import DEFAULT_THRESHOLD
+from metrics import MetricsRegistry, Trace
+from pipeline import (
+    default_pipeline_args,
+    open_local_scorer,
+    plan_video,
+    render_plan,
+    write_keep_csv,
+)
+from plan_io import PLAN_FILES, PlanReader, find_cut_plan, load_cut_plan, save_cut_plan
+from rate_limiter import RateLimiter
+from render_cache import RenderCache
+from replan import replan_cut_plan
+from retention import RetentionManager
+from subtitles import write_edited_subtitles
 from transcript_parser import parse_transcript
 
 
@@ -18,8 +51,81 @@ ALLOWED_VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v"}
 ALLOWED_TRANSCRIPT_EXTENSIONS = {".srt", ".vtt", ".txt"}
 
 BASE_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "outputs", "web")
+DECISION_CACHE_PATH = os.path.join(
+    os.path.dirname(__file__), "outputs", "cache", "decisions.sqlite"
+)
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0")) or None
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "16"))
+EVENTS_KEEPALIVE_SEC = 15.0
+JOB_OUTPUT_FILES = (
+    *PLAN_FILES,
+    "keep_segments.csv",
+    "edited.mp4",
+    "edited.srt",
+    "edited.vtt",
+    "trace.json",
+    "render_trace.json",
+)
+BLOB_DIR = os.path.join(os.path.dirname(__file__), "outputs", "blobs")
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "8192"))
+RENDER_CACHE_DIR = os.path.join(os.path.dirname(__file__), "outputs", "cache", "render")
+RENDER_CACHE_MB = int(os.environ.get("RENDER_CACHE_MB", "10240"))
+PREVIEW_DIR = "preview"
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", "360"))
+PREVIEW_PROXY_DIR = os.path.join(os.path.dirname(__file__), "outputs", "cache", "proxies")
+PREVIEW_PROXY_MB = int(os.environ.get("PREVIEW_PROXY_MB", "4096"))
+PREVIEW_USE_PROXY = os.environ.get("PREVIEW_USE_PROXY", "1") not in ("0", "false", "")
+HLS_MIMETYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+OUTPUT_QUOTA_MB = int(os.environ.get("OUTPUT_QUOTA_MB", "20480"))
+OUTPUT_MAX_AGE_HOURS = float(os.environ.get("OUTPUT_MAX_AGE_HOURS", "168"))
+RETENTION_SWEEP_SEC = float(os.environ.get("RETENTION_SWEEP_SEC", "300"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+LOCAL_DECIDER = os.environ.get("LOCAL_DECIDER", "1") not in ("0", "false", "")
+LOCAL_THRESHOLD = float(os.environ.get("LOCAL_THRESHOLD", str(DEFAULT_THRESHOLD)))
+LOCAL_MODEL = os.environ.get("LOCAL_MODEL") or None
+
+blobs = BlobStore(BLOB_DIR)
+render_cache = (
+    RenderCache(RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MB * 1024 * 1024)
+    if RENDER_CACHE_MB
+    else None
+)
+
+
+class UploadRequest(Request):
+    # Stream each uploaded file straight into the blob store, hashing as it goes.
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return blobs.open_writer()
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024 or None
+jobs = JobQueue(workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT)
+metrics = MetricsRegistry()
+# One limiter for all jobs, so LLM_REQUESTS_PER_MINUTE caps the whole server.
+rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+proxy_builds = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proxy")
+_proxy_pending = set()
+_proxy_lock = threading.Lock()
+
+
+def _job_active(job_id):
+    job = jobs.get(job_id)
+    return job is not None and job["status"] not in FINISHED_STATUSES
+
+
+retention = RetentionManager(
+    BASE_OUTPUT_DIR,
+    max_bytes=OUTPUT_QUOTA_MB * 1024 * 1024,
+    max_age_sec=OUTPUT_MAX_AGE_HOURS * 3600,
+    is_active=_job_active,
+    blobs=blobs,
+    interval_sec=RETENTION_SWEEP_SEC,
+)
 
 
 def _is_allowed(filename, allowed_extensions):
@@ -27,80 +133,125 @@ def _is_allowed(filename, allowed_extensions):
     return ext in allowed_extensions
 
 
-def _write_cut_plan(path, data):
-    with open(path, "w", encoding="utf-8") as handle:
-        json.dump(data, handle, indent=2)
-
-
-def _write_keep_csv(path, segments):
-    with open(path, "w", encoding="utf-8", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["start_sec", "end_sec", "duration_sec"])
-        for start, end in segments:
-            writer.writerow([f"{start:.3f}", f"{end:.3f}", f"{(end - start):.3f}"])
-
-
-def _process_job(video_path, transcript_path, outdir, min_gap, context, batch_size):
-    captions = parse_transcript(transcript_path)
-    candidates = detect_gaps(captions, min_gap=min_gap, context=context)
-
-    decisions = []
-    if candidates:
-        client = GeminiClient()
-        decisions = decide_gaps(candidates, client, batch_size=batch_size, max_retries=2)
-
-    decisions_by_id = {item["id"]: item for item in decisions}
-    for cand in candidates:
-        decision = decisions_by_id.get(cand["id"], {"decision": "KEEP", "reason": ""})
-        cand["decision"] = decision["decision"]
-        cand["reason"] = decision.get("reason", "")
-
-    keep_segments, total_duration = compute_keep_segments(captions, candidates, decisions)
-    estimated_duration = sum(end - start for start, end in keep_segments)
-
-    cut_plan = {
-        "video": video_path,
-        "transcript": transcript_path,
-        "min_gap": min_gap,
-        "context": context,
-        "total_duration_sec": round(total_duration, 3),
-        "estimated_edited_duration_sec": round(estimated_duration, 3),
-        "candidates": candidates,
-        "keep_segments": [
-            {
-                "start_sec": round(start, 3),
-                "end_sec": round(end, 3),
-                "duration_sec": round(end - start, 3),
-            }
-            for start, end in keep_segments
-        ],
-    }
+def _store_upload(storage, dest_path):
+    digest, blob_path = blobs.commit(storage.stream)
+    blobs.link(blob_path, dest_path)
+    return digest
+
 
-    cut_plan_path = os.path.join(outdir, "cut_plan.json")
-    keep_csv_path = os.path.join(outdir, "keep_segments.csv")
-    _write_cut_plan(cut_plan_path, cut_plan)
-    _write_keep_csv(keep_csv_path, keep_segments)
+def _ignore_progress(stage, fraction=0.0):
+    pass
 
+
+def _traced_job(
+    job_id,
+    outdir,
+    func,
+    *args,
+    progress=None,
+    trace_name="trace.json",
+    base_result=None,
+    **kwargs,
+):
+    trace = Trace()
+    status = "error"
+    try:
+        result = func(*args, progress=progress, trace=trace, **kwargs)
+        status = "done"
+        # Re-renders keep the summary of the run that produced the plan.
+        return dict(base_result or {}, **result)
+    finally:
+        trace.write(os.path.join(outdir, trace_name))
+        metrics.add(job_id, status, trace)
+
+
+def _job_args(**settings):
+    settings.setdefault("use_local_decider", LOCAL_DECIDER)
+    settings.setdefault("local_threshold", LOCAL_THRESHOLD)
+    settings.setdefault("local_model", LOCAL_MODEL)
+    return default_pipeline_args(llm_rpm=LLM_REQUESTS_PER_MINUTE, **settings)
+
+
+def _process_job(
+    video_path,
+    transcript_path,
+    outdir,
+    args,
+    preview=False,
+    progress=None,
+    trace=None,
+):
+    progress = progress or _ignore_progress
+    trace = trace or Trace()
+    cache = DecisionCache(DECISION_CACHE_PATH) if args.use_decision_cache else None
+    cache_stats = None
+    try:
+        result = plan_video(
+            args,
+            video_path,
+            transcript_path,
+            outdir,
+            rate_limiter=rate_limiter,
+            cache=cache,
+            trace=trace,
+            progress=progress,
+        )
+    finally:
+        if cache is not None:
+            cache_stats = cache.stats()
+            trace.set(decision_cache=cache_stats)
+            cache.close()
+
+    keep_segments = result["keep_segments"]
     edited_path = os.path.join(outdir, "edited.mp4")
     render_error = None
-    if keep_segments:
+    render_mode_used = None
+    if keep_segments and preview:
         try:
-            render_video(video_path, keep_segments, edited_path)
+            _preview_job(video_path, keep_segments, outdir, progress, trace)
+            render_mode_used = "preview"
+        except Exception as exc:
+            render_error = str(exc)
+    elif keep_segments and args.render:
+        try:
+            render_mode_used = render_plan(
+                args,
+                video_path,
+                keep_segments,
+                outdir,
+                cache=render_cache,
+                trace=trace,
+                progress=progress,
+            )
         except Exception as exc:
             render_error = str(exc)
 
-    summary = {
-        "gaps_found": len(candidates),
-        "cut_count": sum(1 for c in candidates if c.get("decision") == "CUT"),
-        "keep_count": sum(1 for c in candidates if c.get("decision") == "KEEP"),
-        "total_duration_sec": round(total_duration, 2),
-        "estimated_duration_sec": round(estimated_duration, 2),
+    planned = result["planned"]
+    llm_stats = result["llm_stats"]
+    return {
+        "gaps_found": len(planned),
+        "cut_count": sum(1 for c in planned if c.get("decision") == "CUT"),
+        "keep_count": sum(1 for c in planned if c.get("decision") == "KEEP"),
+        "audio_kept_count": len(result["audio_kept"]),
+        "audio_error": result["audio_error"],
+        "total_duration_sec": round(result["total_duration"], 2),
+        "duration_source": result["duration_source"],
+        "estimated_duration_sec": round(result["estimated_duration"], 2),
+        "llm_calls": llm_stats["llm_calls"],
+        "local_decided": llm_stats["local_decided"],
+        "llm_calls_saved": llm_stats["llm_calls_saved"],
+        "prompt_tokens": llm_stats["prompt_tokens"],
+        "cache_hits": cache_stats["hits"] if cache_stats else 0,
+        "cache_misses": cache_stats["misses"] if cache_stats else 0,
+        "subtitle_count": result["subtitle_count"],
+        "render_mode": render_mode_used,
         "render_error": render_error,
         "edited_exists": os.path.isfile(edited_path),
+        "preview_exists": os.path.isfile(
+            os.path.join(outdir, PREVIEW_DIR, PREVIEW_PLAYLIST)
+        ),
     }
 
-    return summary
-
 
 @app.route("/", methods=["GET"])
 def index():
@@ -132,47 +283,391 @@ def process():
             "index.html", error="Unsupported transcript type. Use SRT/VTT/TXT."
         )
 
+    render_mode = request.form.get("render_mode", "reencode")
+    if render_mode not in RENDER_MODES:
+        return render_template("index.html", error="Unknown render mode.")
+
+    local_decider = request.form.get("local_decider")
     try:
-        min_gap = float(request.form.get("min_gap", "0.8"))
-        context = int(request.form.get("context", "2"))
-        batch_size = int(request.form.get("batch_size", "10"))
+        args = _job_args(
+            min_gap=float(request.form.get("min_gap", "0.8")),
+            context=int(request.form.get("context", "2")),
+            batch_size=int(request.form.get("batch_size", "10")),
+            llm_concurrency=int(request.form.get("llm_concurrency", "1")),
+            token_budget=int(request.form.get("token_budget", "0")) or None,
+            render_mode=render_mode,
+            render_workers=int(request.form.get("render_workers", "1")),
+            audio_silence=request.form.get("audio_silence") in ("1", "on", "true"),
+            use_local_decider=LOCAL_DECIDER
+            if local_decider is None
+            else local_decider in ("1", "on", "true"),
+            local_threshold=float(request.form.get("local_threshold", LOCAL_THRESHOLD)),
+        )
     except ValueError:
         return render_template("index.html", error="Settings must be valid numbers.")
+    try:
+        open_local_scorer(args)
+    except (OSError, ValueError) as exc:
+        return render_template("index.html", error=f"Local decider: {exc}")
+    preview = request.form.get("preview") in ("1", "on", "true")
 
     job_id = uuid.uuid4().hex[:10]
     job_dir = os.path.join(BASE_OUTPUT_DIR, job_id)
     os.makedirs(job_dir, exist_ok=True)
+    retention.touch(job_id)
 
     safe_video = secure_filename(video.filename)
     safe_transcript = secure_filename(transcript.filename)
     video_path = os.path.join(job_dir, safe_video)
     transcript_path = os.path.join(job_dir, safe_transcript)
 
-    video.save(video_path)
-    transcript.save(transcript_path)
+    _store_upload(video, video_path)
+    _store_upload(transcript, transcript_path)
 
     try:
-        summary = _process_job(
-            video_path, transcript_path, job_dir, min_gap, context, batch_size
+        jobs.submit(
+            job_id,
+            _traced_job,
+            job_id,
+            job_dir,
+            _process_job,
+            video_path,
+            transcript_path,
+            job_dir,
+            args,
+            preview=preview,
         )
-    except Exception as exc:
-        return render_template("index.html", error=str(exc))
+    except QueueFullError as exc:
+        if _wants_json():
+            return jsonify(error=str(exc)), 503
+        return render_template("index.html", error=str(exc)), 503
 
+    if _wants_json():
+        return jsonify(_job_links(job_id)), 202
     return render_template(
         "result.html",
         job_id=job_id,
         video_name=safe_video,
         transcript_name=safe_transcript,
-        summary=summary,
+        summary=None,
+        **_job_links(job_id),
+    )
+
+
+def _wants_json():
+    return request.accept_mimetypes.best == "application/json"
+
+
+def _job_links(job_id):
+    return {
+        "job_id": job_id,
+        "status_url": url_for("job_status", job_id=job_id),
+        "events_url": url_for("job_events", job_id=job_id),
+    }
+
+
+def _job_payload(job):
+    payload = {key: value for key, value in job.items() if key != "version"}
+    job_dir = os.path.join(BASE_OUTPUT_DIR, job["id"])
+    # The preview playlist is usable while it is still being written.
+    if os.path.isfile(os.path.join(job_dir, PREVIEW_DIR, PREVIEW_PLAYLIST)):
+        payload["preview_url"] = url_for(
+            "outputs", job_id=job["id"], filename=f"{PREVIEW_DIR}/{PREVIEW_PLAYLIST}"
+        )
+    if job["status"] == "done":
+        payload["outputs"] = {
+            name: url_for("outputs", job_id=job["id"], filename=name)
+            for name in JOB_OUTPUT_FILES
+            if os.path.isfile(os.path.join(job_dir, name))
+        }
+    return payload
+
+
+def _render_job(
+    video_path, keep_segments, outdir, render_mode, render_workers, progress, trace
+):
+    edited_path = os.path.join(outdir, "edited.mp4")
+    render_mode_used = render_plan(
+        _job_args(render_mode=render_mode, render_workers=render_workers),
+        video_path,
+        keep_segments,
+        outdir,
+        cache=render_cache,
+        trace=trace,
+        progress=progress,
     )
+    return {"render_mode": render_mode_used, "edited_exists": os.path.isfile(edited_path)}
+
+
+def _build_proxy(video_path, path):
+    try:
+        make_proxy(
+            video_path,
+            PREVIEW_PROXY_DIR,
+            PREVIEW_HEIGHT,
+            max_bytes=PREVIEW_PROXY_MB * 1024 * 1024,
+        )
+    except Exception as exc:
+        print(f"Preview proxy failed for {video_path}: {exc}", file=sys.stderr)
+    finally:
+        with _proxy_lock:
+            _proxy_pending.discard(path)
+
+
+def _queue_proxy(video_path):
+    # Built after the first preview so re-previews can cut from the small copy.
+    path = proxy_path(video_path, PREVIEW_PROXY_DIR, PREVIEW_HEIGHT)
+    with _proxy_lock:
+        if path in _proxy_pending or os.path.isfile(path):
+            return
+        _proxy_pending.add(path)
+    proxy_builds.submit(_build_proxy, video_path, path)
+
+
+def _preview_job(video_path, keep_segments, outdir, progress, trace):
+    progress("previewing")
+    with trace.stage("preview"):
+        render_preview(
+            video_path,
+            keep_segments,
+            os.path.join(outdir, PREVIEW_DIR),
+            height=PREVIEW_HEIGHT,
+            proxy_dir=PREVIEW_PROXY_DIR if PREVIEW_USE_PROXY else None,
+            progress=lambda fraction: progress("previewing", fraction),
+            trace=trace,
+        )
+    if PREVIEW_USE_PROXY:
+        _queue_proxy(video_path)
+    return {"preview_url": f"{PREVIEW_DIR}/{PREVIEW_PLAYLIST}"}
+
+
+def _optional_float(data, key):
+    value = data.get(key)
+    if value in (None, ""):
+        return None
+    return float(value)
+
+
+@app.route("/jobs/<job_id>/replan", methods=["POST"])
+def replan_job(job_id):
+    job_dir = os.path.join(BASE_OUTPUT_DIR, secure_filename(job_id))
+    plan_path = find_cut_plan(job_dir)
+    current = jobs.get(job_id)
+    if current is not None and current["status"] not in FINISHED_STATUSES:
+        return jsonify(error="Job is still running."), 409
+    if plan_path is None:
+        return jsonify(error="Unknown job."), 404
+    retention.touch(job_id)
+
+    data = request.get_json(silent=True) or request.form.to_dict()
+    if not isinstance(data, dict):
+        return jsonify(error="The request body must be a JSON object."), 400
+    overrides = data.get("overrides") or {
+        key[len("override_"):]: value
+        for key, value in data.items()
+        if key.startswith("override_")
+    }
+    if not isinstance(overrides, dict):
+        return jsonify(error="Overrides must map gap ids to CUT or KEEP."), 400
+    render_mode = data.get("render_mode", "reencode")
+    if render_mode not in RENDER_MODES:
+        return jsonify(error="Unknown render mode."), 400
+    try:
+        merge_gap = _optional_float(data, "merge_gap")
+        min_keep = _optional_float(data, "min_keep")
+        render_workers = int(data.get("render_workers", 1))
+    except (TypeError, ValueError):
+        return jsonify(error="merge_gap, min_keep and render_workers must be numbers."), 400
+    try:
+        plan, keep_segments = replan_cut_plan(
+            load_cut_plan(plan_path),
+            overrides=overrides,
+            merge_gap=merge_gap,
+            min_keep=min_keep,
+        )
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    save_cut_plan(job_dir, plan, compress=plan_path.endswith(".gz"))
+    write_keep_csv(os.path.join(job_dir, "keep_segments.csv"), keep_segments)
+    if os.path.isfile(plan.get("transcript") or ""):
+        write_edited_subtitles(job_dir, parse_transcript(plan["transcript"]), keep_segments)
+
+    candidates = plan.get("candidates", [])
+    response = {
+        "job_id": job_id,
+        "cut_count": sum(1 for c in candidates if c.get("decision") == "CUT"),
+        "keep_count": sum(1 for c in candidates if c.get("decision") == "KEEP"),
+        "override_count": sum(1 for c in candidates if "original_decision" in c),
+        "keep_segment_count": len(keep_segments),
+        "estimated_duration_sec": round(plan["estimated_edited_duration_sec"], 2),
+    }
+    if data.get("preview") in (True, "1", "on", "true") and keep_segments:
+        render_args = (_preview_job, plan["video"], keep_segments, job_dir)
+    elif data.get("render") in (True, "1", "on", "true") and keep_segments:
+        render_args = (
+            _render_job,
+            plan["video"],
+            keep_segments,
+            job_dir,
+            render_mode,
+            render_workers,
+        )
+    else:
+        return jsonify(response)
+    try:
+        jobs.submit(
+            job_id,
+            _traced_job,
+            job_id,
+            job_dir,
+            *render_args,
+            trace_name="render_trace.json",
+            base_result=current and current["result"],
+        )
+    except QueueFullError as exc:
+        return jsonify(error=str(exc)), 503
+    response.update(_job_links(job_id))
+    return jsonify(response), 202
+
+
+@app.route("/jobs/<job_id>/approve", methods=["POST"])
+def approve_job(job_id):
+    job_dir = os.path.join(BASE_OUTPUT_DIR, secure_filename(job_id))
+    plan_path = find_cut_plan(job_dir)
+    current = jobs.get(job_id)
+    if current is not None and current["status"] not in FINISHED_STATUSES:
+        return jsonify(error="Job is still running."), 409
+    if plan_path is None:
+        return jsonify(error="Unknown job."), 404
+    retention.touch(job_id)
+
+    data = request.get_json(silent=True) or request.form.to_dict()
+    if not isinstance(data, dict):
+        return jsonify(error="The request body must be a JSON object."), 400
+    render_mode = data.get("render_mode", "reencode")
+    if render_mode not in RENDER_MODES:
+        return jsonify(error="Unknown render mode."), 400
+    try:
+        render_workers = int(data.get("render_workers", 1))
+    except (TypeError, ValueError):
+        return jsonify(error="render_workers must be a number."), 400
+    # Only the header and keep segments are needed, not the candidates.
+    plan = PlanReader(plan_path)
+    keep_segments = list(plan.iter_keep_segments())
+    if not keep_segments:
+        return jsonify(error="The plan has no keep segments to render."), 400
+
+    try:
+        jobs.submit(
+            job_id,
+            _traced_job,
+            job_id,
+            job_dir,
+            _render_job,
+            plan.header["video"],
+            keep_segments,
+            job_dir,
+            render_mode,
+            render_workers,
+            trace_name="render_trace.json",
+            base_result=current and current["result"],
+        )
+    except QueueFullError as exc:
+        return jsonify(error=str(exc)), 503
+    return jsonify(dict(_job_links(job_id), keep_segment_count=len(keep_segments))), 202
+
+
+@app.route("/metrics")
+def metrics_snapshot():
+    snapshot = metrics.snapshot()
+    snapshot["queue"] = jobs.counts()
+    return jsonify(snapshot)
+
+
+def _admin_denied():
+    # Admin routes are off unless ADMIN_TOKEN is set, and then need it as a bearer token.
+    if not ADMIN_TOKEN:
+        return jsonify(error="Not found."), 404
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")
+    ):
+        return jsonify(error="Admin token required."), 403
+    return None
+
+
+@app.route("/admin/storage")
+def storage_stats():
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    return jsonify(retention.stats())
+
+
+@app.route("/admin/storage/sweep", methods=["POST"])
+def storage_sweep():
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    evicted = retention.sweep()
+    return jsonify(evicted=evicted, **retention.stats())
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job."), 404
+    return jsonify(_job_payload(job))
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job."), 404
+
+    def stream(job):
+        version = None
+        while job is not None:
+            if job["version"] == version:
+                yield ": keepalive\n\n"
+            else:
+                version = job["version"]
+                yield f"event: {job['status']}\ndata: {json.dumps(_job_payload(job))}\n\n"
+                if job["status"] in FINISHED_STATUSES:
+                    return
+            job = jobs.wait(job_id, version, timeout=EVENTS_KEEPALIVE_SEC)
+
+    return Response(
+        stream_with_context(stream(job)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.errorhandler(413)
+def upload_too_large(exc):
+    message = f"Upload is larger than the {MAX_UPLOAD_MB} MB limit."
+    if _wants_json():
+        return jsonify(error=message), 413
+    return render_template("index.html", error=message), 413
 
 
-@app.route("/outputs/<job_id>/<filename>")
+@app.route("/outputs/<job_id>/<path:filename>")
 def outputs(job_id, filename):
+    job_id = secure_filename(job_id)
     job_dir = os.path.join(BASE_OUTPUT_DIR, job_id)
-    return send_from_directory(job_dir, filename)
+    retention.touch(job_id)
+    mimetype = HLS_MIMETYPES.get(os.path.splitext(filename)[1].lower())
+    if mimetype is None:
+        return send_from_directory(job_dir, filename)
+    # The playlist changes while the preview encodes, so it must not be cached.
+    return send_from_directory(job_dir, filename, mimetype=mimetype, max_age=0)
 
 
 if __name__ == "__main__":
     os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
+    retention.start()
     app.run(host="127.0.0.1", port=5000, debug=False)